@@ -1,4 +1,4 @@
-import json
+import orjson
 import numpy as np
 import faiss
 from google.cloud import storage
@@ -9,6 +9,40 @@ BUCKET_NAME = "rag-source-documents"
 VECTOR_FILE_IN_BUCKET = "vector-search-inputs/vector_search_input.json" 
 INDEX_OUTPUT_FILE = "local_app_index.faiss"    # The name for our local index
 
+# HNSW graph parameters: M links per node, build-time and query-time beam widths
+HNSW_M = 32
+HNSW_EF_CONSTRUCTION = 200
+HNSW_EF_SEARCH = 64
+
+# Above this many vectors, switch to a product-quantised IVF index: 96-byte codes
+# instead of 3 KiB float32 rows keep search in cache. Smaller corpora stay on HNSW,
+# which is exact enough and too small to train IVF/PQ codebooks well.
+IVFPQ_MIN_VECTORS = 100_000
+IVFPQ_NLIST = 256
+IVFPQ_M = 96          # sub-quantizers; must divide the dimension (768 / 96 = 8)
+IVFPQ_NBITS = 8
+IVFPQ_NPROBE = 16
+
+def build_faiss_index(embeddings, dimension):
+    """Pick and build the index type for the corpus size; embeddings must be normalised."""
+    if len(embeddings) >= IVFPQ_MIN_VECTORS:
+        print(f"Building FAISS IVF{IVFPQ_NLIST},PQ{IVFPQ_M} index (inner product on normalised vectors)...")
+        quantizer = faiss.IndexFlatIP(dimension)
+        index = faiss.IndexIVFPQ(quantizer, dimension, IVFPQ_NLIST, IVFPQ_M, IVFPQ_NBITS, faiss.METRIC_INNER_PRODUCT)
+        index.train(embeddings)
+        index.add(embeddings)
+        index.nprobe = IVFPQ_NPROBE  # Saved with the index
+        return index
+
+    # HNSW keeps top-k recall close to an exact scan while searching in roughly
+    # logarithmic time instead of comparing against every vector.
+    print("Building FAISS HNSW index (inner product on normalised vectors)...")
+    index = faiss.IndexHNSWFlat(dimension, HNSW_M, faiss.METRIC_INNER_PRODUCT)
+    index.hnsw.efConstruction = HNSW_EF_CONSTRUCTION
+    index.add(embeddings)
+    index.hnsw.efSearch = HNSW_EF_SEARCH  # Saved with the index, so readers get it too
+    return index
+
 def build_index_from_gcs():
     """Reads vectors directly from GCS and builds a local FAISS index."""
     try:
@@ -17,13 +51,14 @@ def build_index_from_gcs():
         bucket = storage_client.bucket(BUCKET_NAME)
         blob = bucket.blob(VECTOR_FILE_IN_BUCKET)
 
-        print(f"Downloading {VECTOR_FILE_IN_BUCKET} from GCS bucket {BUCKET_NAME}...")
-        # Download the file content as a string
-        file_content = blob.download_as_string()
-        
-        # Decode the byte string and split into individual lines
-        lines = file_content.decode('utf-8').splitlines()
-        vectors_data = [json.loads(line) for line in lines]
+        print(f"Streaming {VECTOR_FILE_IN_BUCKET} from GCS bucket {BUCKET_NAME}...")
+        # Parse the JSONL file line by line straight into float32 rows, so neither the
+        # whole file nor the per-record dicts and float lists are held at once
+        rows = []
+        with blob.open("rb") as vector_file:
+            for line in vector_file:
+                if line.strip():
+                    rows.append(np.asarray(orjson.loads(line)['embedding'], dtype=np.float32))
         print("File downloaded and parsed successfully.")
 
     except Exception as e:
@@ -31,22 +66,24 @@ def build_index_from_gcs():
         print("Please ensure the bucket name and file path are correct and you have the right permissions.")
         return
 
-    if not vectors_data:
+    if not rows:
         print("❌ ERROR: No vectors found in the input file.")
         return
 
-    # --- (The rest of the script is the same as before) ---
-    
-    # Extract embeddings and convert to a NumPy array
+    # Stack the rows into one contiguous NumPy array
     dimension = 768 # Assumes your embedding model's dimension
-    embeddings = np.array([item['embedding'] for item in vectors_data]).astype('float32')
+    embeddings = np.vstack(rows)
+    del rows
     
     print(f"Found {len(embeddings)} vectors with dimension {dimension}.")
 
+    # Unit-length vectors make inner product equal to cosine similarity, the metric
+    # the Vertex embeddings are meant for. Queries must be normalised the same way
+    # (faiss.normalize_L2) before searching this index.
+    faiss.normalize_L2(embeddings)
+
     # Build the FAISS index
-    print("Building FAISS index...")
-    index = faiss.IndexFlatL2(dimension)
-    index.add(embeddings)
+    index = build_faiss_index(embeddings, dimension)
     
     # Save the index to a file
     print(f"Saving index to {INDEX_OUTPUT_FILE}...")
@@ -56,5 +93,5 @@ def build_index_from_gcs():
 
 if __name__ == "__main__":
     # Ensure you have the necessary libraries installed:
-    # pip install faiss-cpu numpy google-cloud-storage
+    # pip install faiss-cpu numpy orjson google-cloud-storage
     build_index_from_gcs()
\ No newline at end of file
@@ -1,17 +1,39 @@
 import streamlit as st
+import atexit
 import requests
-import json
-import pandas as pd
+from requests.adapters import HTTPAdapter
+from requests_toolbelt.multipart.encoder import MultipartEncoder, MultipartEncoderMonitor
+from urllib3.util.retry import Retry
+import copy
+import hashlib
+import io
+import os
+import orjson
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
+from typing import TYPE_CHECKING
+from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
+
+if TYPE_CHECKING:
+    import numpy as np
+    import pandas as pd
 
 # --- CONFIGURATION ---
 API_BASE_URL = "http://localhost:8081"
-LANGUAGE_OPTIONS = ["English", "Bengali", "Hindi", "Marathi", "Tamil", "Telugu", "Gujarati", "Kannada"]
-STATE_OPTIONS = [
+JOB_POLL_INTERVAL_SECONDS = float(os.environ.get("JOB_POLL_INTERVAL_SECONDS", "0.5"))
+JOB_EXPECTED_SECONDS = 90  # Rough generation time used to pace the progress bar
+EMAIL_JOB_EXPECTED_SECONDS = 300  # Assessment batches generate and email one guide per student
+JOB_MAX_WAIT_FACTOR = 5  # Give up on a job still unfinished after this many expected durations
+LANGUAGE_OPTIONS = ("English", "Bengali", "Hindi", "Marathi", "Tamil", "Telugu", "Gujarati", "Kannada")
+STATE_OPTIONS = (
     "Corporate", "West Bengal", "Maharashtra", "Gujarat", "Tamil Nadu", "Karnataka",
     "Kerala", "Andhra Pradesh", "Telangana", "Odisha", "Punjab", "Haryana",
     "Rajasthan", "Uttar Pradesh", "Madhya Pradesh", "Delhi", "Assam"
-]
+)
+LANGUAGE_INDEX = {name: idx for idx, name in enumerate(LANGUAGE_OPTIONS)}
+STATE_INDEX = {name: idx for idx, name in enumerate(STATE_OPTIONS)}
 CONTENT_TYPE_OPTIONS = [
     "Learning Guide",
     "Facilitator Notes",
@@ -21,80 +43,375 @@ CONTENT_TYPE_OPTIONS = [
 ]
 TONE_OPTIONS = ["Professional", "Friendly", "Motivational", "Coaching", "Inspirational"]
 LENGTH_OPTIONS = ["Brief", "Standard", "In-depth"]
+APP_CSS = """
+<style>
+    .stApp {background-color: #f5f7fb;}
+    .stTabs [role="tab"] {padding: 0.75rem 1.5rem; font-weight: 600;}
+    .stTabs [role="tab"][aria-selected="true"] {background-color: #ffffff; border-bottom: 3px solid #2c7be5;}
+    .status-pill {padding: 0.35rem 0.75rem; border-radius: 999px; background-color: #edf2ff; color: #1d4ed8; font-size: 0.8rem; display: inline-block;}
+    .info-card {background: #ffffff; border-radius: 12px; padding: 1.2rem; box-shadow: 0 10px 20px rgba(15, 23, 42, 0.06);}
+</style>
+"""
 
 # --- SESSION STATE INITIALIZATION ---
-if 'download_info' not in st.session_state:
-    st.session_state['download_info'] = None
-if 'email_results' not in st.session_state:
-    st.session_state['email_results'] = None
-if 'detected_location' not in st.session_state:
-    st.session_state['detected_location'] = None
-if 'data_loaded' not in st.session_state:
-    st.session_state['data_loaded'] = {'courses': False, 'holidays': False, 'guidelines': False}
-if 'available_documents' not in st.session_state:
-    st.session_state['available_documents'] = []
-if 'documents_loaded' not in st.session_state:
-    st.session_state['documents_loaded'] = False
+SESSION_DEFAULTS = {
+    'download_info': None,
+    'email_results': None,
+    'detected_location': None,
+    'data_loaded': {'courses': False, 'holidays': False, 'guidelines': False},
+    'available_documents': [],
+    'available_documents_lower': [],
+    'available_documents_index': {},
+    'documents_loaded': False,
+    'pending_uploads': {},
+    'uploaded_fingerprints': {},
+}
+for key, default in SESSION_DEFAULTS.items():
+    # Deep-copy so sessions never share the mutable defaults
+    st.session_state.setdefault(key, copy.deepcopy(default))
+
+# --- HTTP SESSION ---
+@st.cache_resource
+def get_http_session() -> requests.Session:
+    """Create one keep-alive session per server process so API calls reuse pooled sockets"""
+    session = requests.Session()
+    adapter = HTTPAdapter(
+        pool_connections=16,
+        pool_maxsize=32,
+        max_retries=Retry(total=3, backoff_factor=0.2)
+    )
+    session.mount("http://", adapter)
+    session.headers.update({"Connection": "keep-alive", "Accept-Encoding": "gzip, deflate"})
+    atexit.register(session.close)
+    # Prime the pool so the first real call of the first page render does not pay
+    # for the TCP handshake; the backend may not be up yet, which is fine.
+    try:
+        session.head(f"{API_BASE_URL}/health", timeout=2)
+    except requests.exceptions.RequestException:
+        pass
+    return session
+
+_SESSION = get_http_session()
 
 # --- HELPER FUNCTIONS ---
+@st.cache_data(ttl=3600, show_spinner=False)
+def _detect_location_cached(client_ip: str):
+    """Look up the location once per client IP per hour; failures raise so they are never cached"""
+    # Without a known client IP the backend falls back to the address it sees
+    payload = {"ip": client_ip} if client_ip else {}
+    # Bounded so a slow geolocation lookup can never hold up the first render. The
+    # backend's ip-api call is a single 2 s attempt (no retries) before it answers
+    # with its "not detected" fallback, so 3 s normally still receives that answer.
+    response = _SESSION.post(f"{API_BASE_URL}/detect_location", json=payload, timeout=(0.5, 3))
+    response.raise_for_status()
+    return orjson.loads(response.content)
+
+def get_client_ip() -> str:
+    """Best-effort browser IP: the first X-Forwarded-For hop behind a proxy, else the direct peer"""
+    try:
+        forwarded = st.context.headers.get("X-Forwarded-For", "")
+        if forwarded:
+            return forwarded.split(",")[0].strip()
+        return getattr(st.context, "ip_address", None) or ""
+    except Exception:
+        return ""
+
+# Used when the backend cannot be reached in time. It is kept in session_state, so that
+# session does not block on the lookup again at every rerun, but it is never put in
+# the shared cache, so later sessions still get a real lookup.
+LOCATION_FALLBACK = {
+    "location": {"city": "", "state": "", "country": "India", "detected": False},
+    "suggested_language": "English"
+}
+
 def detect_location():
     """Detect user location from IP"""
     try:
-        response = requests.post(f"{API_BASE_URL}/detect_location", json={})
-        if response.status_code == 200:
-            return response.json()
-        return None
+        return _detect_location_cached(get_client_ip())
     except:
-        return None
+        return copy.deepcopy(LOCATION_FALLBACK)
 
-def fetch_available_documents():
-    """Fetch list of available documents from Pinecone"""
-    try:
-        response = requests.get(f"{API_BASE_URL}/get_documents")
-        if response.status_code == 200:
-            data = response.json()
-            return data.get('documents', [])
-        return []
-    except Exception as e:
-        st.error(f"Error fetching documents: {e}")
-        return []
-
-def call_api(endpoint: str, payload: dict):
+@st.cache_resource(ttl=300, show_spinner=False)
+def fetch_available_documents() -> tuple:
+    """Fetch the available documents with their lowercase search keys and bigram index; failures raise so they are never cached"""
+    # cache_resource hands every session the same objects; none of them is ever mutated
+    # Bounded so a stalled backend cannot hold the startup threads indefinitely
+    response = _SESSION.get(f"{API_BASE_URL}/get_documents", timeout=10)
+    response.raise_for_status()
+    docs = tuple(orjson.loads(response.content).get('documents', []))
+    docs_lower = tuple(d.lower() for d in docs)
+    return docs, docs_lower, build_bigram_index(docs_lower)
+
+def build_bigram_index(docs_lower: tuple) -> dict:
+    """Map every two-character substring to the positions of the documents containing it"""
+    index = {}
+    for position, doc in enumerate(docs_lower):
+        for start in range(len(doc) - 1):
+            index.setdefault(doc[start:start + 2], set()).add(position)
+    return {bigram: frozenset(positions) for bigram, positions in index.items()}
+
+def filter_documents(query: str, docs, docs_lower, bigram_index: dict) -> list:
+    """Documents whose lowercase title contains query (already lowercased), in list order"""
+    if len(query) < 2 or not bigram_index:
+        return [d for d, d_lower in zip(docs, docs_lower) if query in d_lower]
+    # Only titles holding every bigram of the query can contain it; confirm those with `in`
+    postings = sorted((bigram_index.get(query[i:i + 2], frozenset()) for i in range(len(query) - 1)), key=len)
+    candidates = postings[0].intersection(*postings[1:])
+    return [docs[i] for i in sorted(candidates) if query in docs_lower[i]]
+
+def run_in_threads(*calls):
+    """Run independent blocking calls concurrently and return their futures in call order"""
+    ctx = get_script_run_ctx()
+
+    def _with_ctx(fn):
+        add_script_run_ctx(threading.current_thread(), ctx)
+        return fn()
+
+    with ThreadPoolExecutor(max_workers=max(len(calls), 1)) as pool:
+        return [pool.submit(_with_ctx, fn) for fn in calls]
+
+DOWNLOAD_CHUNK_SIZE = 64 * 1024
+
+def _parse_api_response(response):
+    content_type = response.headers.get('content-type', '')
+    if 'application/json' in content_type:
+        # orjson parses the raw (already decompressed) bytes directly, skipping the text decode
+        return orjson.loads(response.content)
+    # Generated documents are copied chunk by chunk into a single buffer that
+    # st.download_button can serve directly, instead of materialising
+    # response.content on top of it.
+    buffer = io.BytesIO()
+    for chunk in response.iter_content(chunk_size=DOWNLOAD_CHUNK_SIZE):
+        buffer.write(chunk)
+    buffer.seek(0)
+    return buffer
+
+def _wait_for_job(job_id: str, progress_text: str, expected_seconds: float = JOB_EXPECTED_SECONDS):
+    """Poll a background job until it finishes, then fetch its result; None if it runs past the deadline"""
+    progress = st.progress(0, text=progress_text)
+    started = time.monotonic()
+    # A job wedged in 'running' (e.g. a hung LLM or SMTP call) must not spin the page forever
+    deadline = started + expected_seconds * JOB_MAX_WAIT_FACTOR
+    while True:
+        status_response = _SESSION.get(f"{API_BASE_URL}/jobs/{job_id}", timeout=10)
+        status_response.raise_for_status()
+        if orjson.loads(status_response.content).get('status') not in ('queued', 'running'):
+            break
+        if time.monotonic() >= deadline:
+            progress.empty()
+            st.error(
+                f"⏱️ The job did not finish within {int(expected_seconds * JOB_MAX_WAIT_FACTOR)}s. "
+                "It may still complete on the server; please try again later."
+            )
+            return None
+        elapsed = time.monotonic() - started
+        progress.progress(
+            min(int(elapsed / expected_seconds * 100), 95),
+            text=f"{progress_text} ({int(elapsed)}s)"
+        )
+        time.sleep(JOB_POLL_INTERVAL_SECONDS)
+    progress.empty()
+    
+    result = _SESSION.get(f"{API_BASE_URL}/jobs/{job_id}/result", stream=True, timeout=120)
+    result.raise_for_status()
+    return _parse_api_response(result)
+
+def submit_and_poll(endpoint: str, payload: dict, progress_text: str):
+    """Submit a generation job, poll until it finishes, then fetch its result"""
     try:
-        url = f"{API_BASE_URL}{endpoint}"
-        response = requests.post(url, json=payload, stream=True, timeout=120)
+        response = _SESSION.post(f"{API_BASE_URL}{endpoint}/submit", json=payload, timeout=30)
         response.raise_for_status()
-        content_type = response.headers.get('content-type')
-        return response.json() if 'application/json' in content_type else response.content
-    except requests.exceptions.RequestException as e:
+        return _wait_for_job(orjson.loads(response.content)['job_id'], progress_text)
+    except (requests.exceptions.RequestException, orjson.JSONDecodeError) as e:
         st.error(f"API Connection Error: {e}")
         return None
 
+def submit_file_and_poll(endpoint: str, file, progress_text: str, expected_seconds: float = JOB_EXPECTED_SECONDS):
+    """Upload a file to a job endpoint, poll until the job finishes, then fetch its result"""
+    upload_progress = st.progress(0, text="Uploading file...")
+    last_percent = 0
+    
+    def on_upload_progress(bytes_sent: int, total_bytes: int):
+        # The monitor fires per chunk read; only redraw when the whole percentage moves
+        nonlocal last_percent
+        percent = min(int(bytes_sent * 100 / total_bytes), 100) if total_bytes else 100
+        if percent != last_percent:
+            last_percent = percent
+            upload_progress.progress(percent, text=f"Uploading file... {percent}%")
+    
+    try:
+        job = _post_file(f"{endpoint}/submit", file, on_progress=on_upload_progress)
+        upload_progress.empty()
+        return _wait_for_job(job['job_id'], progress_text, expected_seconds)
+    except (requests.exceptions.RequestException, orjson.JSONDecodeError) as e:
+        st.error(f"API Error: {e}")
+        return None
+
+def _post_files(endpoint: str, files: dict, on_progress=None):
+    """POST uploaded files (form field -> file) as one multipart body; raises on failure and never touches st.*"""
+    url = f"{API_BASE_URL}{endpoint}"
+    # Stream the multipart body straight from the upload buffers instead of
+    # letting requests assemble the whole payload in memory first.
+    for file in files.values():
+        file.seek(0)
+    encoder = MultipartEncoder(
+        fields={
+            field: (file.name, file, file.type or 'application/octet-stream')
+            for field, file in files.items()
+        }
+    )
+    body = encoder
+    # on_progress(bytes_sent, total_bytes) is called from this thread as the body streams
+    if on_progress is not None:
+        body = MultipartEncoderMonitor(encoder, lambda monitor: on_progress(monitor.bytes_read, monitor.len))
+    response = _SESSION.post(
+        url,
+        data=body,
+        headers={'Content-Type': encoder.content_type},
+        timeout=300
+    )
+    response.raise_for_status()
+    return orjson.loads(response.content)
+
+def _post_file(endpoint: str, file, on_progress=None):
+    """POST a single uploaded file as the 'file' form field"""
+    return _post_files(endpoint, {'file': file}, on_progress)
+
 def upload_file_to_api(endpoint: str, file):
     try:
-        url = f"{API_BASE_URL}{endpoint}"
-        files = {'file': file}
-        response = requests.post(url, files=files, timeout=300)
-        response.raise_for_status()
-        return response.json()
-    except requests.exceptions.RequestException as e:
+        return _post_file(endpoint, file)
+    except (requests.exceptions.RequestException, orjson.JSONDecodeError) as e:
         st.error(f"API Error: {e}")
         return None
 
+@st.cache_resource
+def get_upload_pool() -> ThreadPoolExecutor:
+    """One shared pool per server process for background reference-data uploads"""
+    return ThreadPoolExecutor(max_workers=4, thread_name_prefix="upload")
+
+FINGERPRINT_PREFIX_BYTES = 1 << 20
+
+def file_fingerprint(file) -> str:
+    """Cheap identity for an uploaded file: BLAKE2b of its first 1 MiB plus its size"""
+    buffer = file.getbuffer()
+    digest = hashlib.blake2b(buffer[:FINGERPRINT_PREFIX_BYTES], digest_size=16)
+    digest.update(str(buffer.nbytes).encode('ascii'))
+    return digest.hexdigest()
+
+def start_upload(kind: str, endpoint: str, file):
+    """Hand an upload to the background pool unless this exact file was already loaded"""
+    fingerprint = file_fingerprint(file)
+    if st.session_state['uploaded_fingerprints'].get(kind) == fingerprint:
+        st.info("ℹ️ This file is already loaded")
+        return
+    future = get_upload_pool().submit(_post_file, endpoint, file)
+    st.session_state['pending_uploads'][kind] = (future, fingerprint)
+
+def poll_upload(kind: str, pending_text: str):
+    """Return ('pending', None) while uploading, ('done', result) once finished, else (None, None)"""
+    pending = st.session_state['pending_uploads'].get(kind)
+    if pending is None:
+        return None, None
+    future, fingerprint = pending
+    if not future.done():
+        st.caption(f"⏳ {pending_text}")
+        return 'pending', None
+    del st.session_state['pending_uploads'][kind]
+    try:
+        result = future.result()
+    except (requests.exceptions.RequestException, orjson.JSONDecodeError) as e:
+        st.error(f"API Error: {e}")
+        return 'done', None
+    if result and result.get('success'):
+        st.session_state['uploaded_fingerprints'][kind] = fingerprint
+    return 'done', result
+
+def start_bundle_upload(files: dict):
+    """Send every selected reference file that is not already loaded in one background request"""
+    fingerprints = {kind: file_fingerprint(file) for kind, file in files.items()}
+    loaded = st.session_state['uploaded_fingerprints']
+    files = {kind: file for kind, file in files.items() if loaded.get(kind) != fingerprints[kind]}
+    if not files:
+        st.info("ℹ️ These files are already loaded")
+        return
+    future = get_upload_pool().submit(_post_files, "/upload/reference_bundle", files)
+    st.session_state['pending_uploads']['bundle'] = (future, {kind: fingerprints[kind] for kind in files})
+
+def poll_bundle_upload():
+    """Report a finished bundle upload per file and record the ones that loaded"""
+    pending = st.session_state['pending_uploads'].get('bundle')
+    if pending is None:
+        return
+    future, fingerprints = pending
+    if not future.done():
+        st.caption("⏳ Loading reference data...")
+        return
+    del st.session_state['pending_uploads']['bundle']
+    try:
+        result = future.result()
+    except (requests.exceptions.RequestException, orjson.JSONDecodeError) as e:
+        st.error(f"API Error: {e}")
+        return
+    for kind, kind_result in (result.get('results') or {}).items():
+        if kind_result.get('success'):
+            st.session_state['uploaded_fingerprints'][kind] = fingerprints[kind]
+            st.session_state['data_loaded'][kind] = True
+            st.success(f"✅ Loaded {kind}")
+        else:
+            st.error(f"❌ Failed to load {kind}")
+
+@st.fragment(run_every=1.0)
+def watch_uploads():
+    """Poll pending uploads without rerunning the page; rerun once any of them finishes"""
+    if any(future.done() for future, _ in st.session_state['pending_uploads'].values()):
+        st.rerun()
+
+def results_cache_key(records: list) -> str:
+    """Stable digest of an API result list, used to key cached derivations"""
+    return hashlib.sha1(orjson.dumps(records, option=orjson.OPT_SORT_KEYS, default=str)).hexdigest()
+
+@st.cache_resource(max_entries=8)
+def build_email_dataframe(results_key: str, _records: list) -> "pd.DataFrame":
+    """Build the delivery-status DataFrame once per result set; shared, so never mutate it"""
+    # pandas is only needed once an email report is shown, so it is not imported at startup
+    import pandas as pd
+    return pd.DataFrame(_records)
+
+@st.cache_data(max_entries=8)
+def build_email_csv(results_key: str, _records: list) -> bytes:
+    """Serialize the delivery report once per result set, from the same cached DataFrame the table shows"""
+    return build_email_dataframe(results_key, _records).to_csv(index=False).encode('utf-8')
+
+def style_status_column(status: "pd.Series") -> "np.ndarray":
+    """Colour delivery statuses with whole-column masks instead of a per-cell callback"""
+    import numpy as np
+    text = status.astype(str)
+    sent = text.str.contains('✅', regex=False)
+    failed = text.str.contains('❌', regex=False)
+    return np.where(
+        sent,
+        'background-color: #d4edda; color: #155724',
+        np.where(failed, 'background-color: #f8d7da; color: #721c24', '')
+    )
+
 def render_document_selector(section_key: str, description: str):
     st.subheader("📚 Select Source Documents")
     st.markdown(description)
     
     docs = st.session_state.get('available_documents', [])
+    docs_lower = st.session_state.get('available_documents_lower', [])
+    # st.text_input only commits (and reruns the script) on Enter or blur, so typing
+    # does not trigger a rerun per keystroke; no extra debounce component is needed.
     search_value = st.text_input(
         "🔍 Search documents:",
         key=f"{section_key}_doc_search",
-        placeholder="Type to filter..."
+        placeholder="Type and press Enter to filter..."
     )
     
     filtered_docs = docs
     if search_value:
-        filtered_docs = [d for d in docs if search_value.lower() in d.lower()]
+        query = search_value.lower()
+        filtered_docs = filter_documents(query, docs, docs_lower, st.session_state.get('available_documents_index', {}))
         if not filtered_docs:
             st.info("No documents matched your search. Clear the filter to see all items.")
     
@@ -116,26 +433,38 @@ def render_document_selector(section_key: str, description: str):
 
 # --- STREAMLIT APP LAYOUT ---
 st.set_page_config(page_title="AI Agent Toolkit", layout="wide")
-st.markdown(
-    """
-    <style>
-        .stApp {background-color: #f5f7fb;}
-        .stTabs [role="tab"] {padding: 0.75rem 1.5rem; font-weight: 600;}
-        .stTabs [role="tab"][aria-selected="true"] {background-color: #ffffff; border-bottom: 3px solid #2c7be5;}
-        .status-pill {padding: 0.35rem 0.75rem; border-radius: 999px; background-color: #edf2ff; color: #1d4ed8; font-size: 0.8rem; display: inline-block;}
-        .info-card {background: #ffffff; border-radius: 12px; padding: 1.2rem; box-shadow: 0 10px 20px rgba(15, 23, 42, 0.06);}
-    </style>
-    """,
-    unsafe_allow_html=True
-)
+# Re-emitted on every run: Streamlit drops any element a rerun does not produce again
+st.markdown(APP_CSS, unsafe_allow_html=True)
 
-# --- LOAD AVAILABLE DOCUMENTS ON STARTUP ---
-if not st.session_state['documents_loaded']:
-    with st.spinner("Loading available documents from knowledge base..."):
-        docs = fetch_available_documents()
-        if docs:
-            st.session_state['available_documents'] = docs
-            st.session_state['documents_loaded'] = True
+# --- LOAD AVAILABLE DOCUMENTS AND LOCATION ON STARTUP ---
+# Both calls are independent, so fire them together and wait for the slower one.
+need_documents = not st.session_state['documents_loaded']
+need_location = not st.session_state['detected_location']
+if need_documents or need_location:
+    with st.spinner("Loading knowledge base and detecting location..."):
+        startup_calls = []
+        if need_documents:
+            startup_calls.append(fetch_available_documents)
+        if need_location:
+            startup_calls.append(detect_location)
+        startup_futures = run_in_threads(*startup_calls)
+
+        if need_documents:
+            docs_future = startup_futures.pop(0)
+            try:
+                docs, docs_lower, docs_index = docs_future.result()
+            except Exception as e:
+                st.error(f"Error fetching documents: {e}")
+                docs, docs_lower, docs_index = (), (), {}
+            if docs:
+                st.session_state['available_documents'] = docs
+                st.session_state['available_documents_lower'] = docs_lower
+                st.session_state['available_documents_index'] = docs_index
+                st.session_state['documents_loaded'] = True
+        if need_location:
+            location_data = startup_futures.pop(0).result()
+            if location_data:
+                st.session_state['detected_location'] = location_data
 
 # --- SIDEBAR FOR DATA UPLOADS ---
 with st.sidebar:
@@ -144,73 +473,85 @@ with st.sidebar:
     st.subheader("📊 Upload Reference Data")
     st.markdown("*Upload these files once to enable enhanced features*")
     
+    pending_uploads = st.session_state['pending_uploads']
+    
     with st.expander("📚 Course Duration Data"):
         course_file = st.file_uploader("Upload Course CSV", type=['csv'], key="course_upload")
-        if course_file and st.button("Load Courses"):
-            with st.spinner("Loading course data..."):
-                result = upload_file_to_api("/upload/course_data", course_file)
-                if result and result.get('success'):
-                    st.success(f"✅ Loaded {result.get('courses_loaded')} courses")
-                    st.session_state['data_loaded']['courses'] = True
-                else:
-                    st.error("❌ Failed to load courses")
+        if course_file and st.button("Load Courses", disabled='courses' in pending_uploads or 'bundle' in pending_uploads):
+            start_upload('courses', "/upload/course_data", course_file)
+        status, result = poll_upload('courses', "Loading course data...")
+        if status == 'done':
+            if result and result.get('success'):
+                st.success(f"✅ Loaded {result.get('courses_loaded')} courses")
+                st.session_state['data_loaded']['courses'] = True
+            else:
+                st.error("❌ Failed to load courses")
     
     with st.expander("🗓️ Holiday Calendar"):
         holiday_file = st.file_uploader("Upload Holidays CSV", type=['csv'], key="holiday_upload")
-        if holiday_file and st.button("Load Holidays"):
-            with st.spinner("Loading holiday data..."):
-                result = upload_file_to_api("/upload/holidays", holiday_file)
-                if result and result.get('success'):
-                    region_count = result.get('states_loaded') or result.get('regions_loaded') or 0
-                    label = "region" if region_count == 1 else "regions"
-                    st.success(f"✅ Loaded holidays for {region_count} {label}")
-                    st.session_state['data_loaded']['holidays'] = True
-                else:
-                    st.error("❌ Failed to load holidays")
+        if holiday_file and st.button("Load Holidays", disabled='holidays' in pending_uploads or 'bundle' in pending_uploads):
+            start_upload('holidays', "/upload/holidays", holiday_file)
+        status, result = poll_upload('holidays', "Loading holiday data...")
+        if status == 'done':
+            if result and result.get('success'):
+                region_count = result.get('states_loaded') or result.get('regions_loaded') or 0
+                label = "region" if region_count == 1 else "regions"
+                st.success(f"✅ Loaded holidays for {region_count} {label}")
+                st.session_state['data_loaded']['holidays'] = True
+            else:
+                st.error("❌ Failed to load holidays")
     
     with st.expander("📝 Assessment Guidelines"):
         guidelines_file = st.file_uploader("Upload Guidelines TXT", type=['txt'], key="guidelines_upload")
-        if guidelines_file and st.button("Load Guidelines"):
-            with st.spinner("Loading guidelines..."):
-                result = upload_file_to_api("/upload/guidelines", guidelines_file)
-                if result and result.get('success'):
-                    st.success(f"✅ Loaded guidelines ({result.get('guidelines_length')} chars)")
-                    st.session_state['data_loaded']['guidelines'] = True
-                else:
-                    st.error("❌ Failed to load guidelines")
+        if guidelines_file and st.button("Load Guidelines", disabled='guidelines' in pending_uploads or 'bundle' in pending_uploads):
+            start_upload('guidelines', "/upload/guidelines", guidelines_file)
+        status, result = poll_upload('guidelines', "Loading guidelines...")
+        if status == 'done':
+            if result and result.get('success'):
+                st.success(f"✅ Loaded guidelines ({result.get('guidelines_length')} chars)")
+                st.session_state['data_loaded']['guidelines'] = True
+            else:
+                st.error("❌ Failed to load guidelines")
+    
+    # Several files selected: one request loads them all instead of one round trip each
+    bundle_files = {
+        kind: file
+        for kind, file in (('courses', course_file), ('holidays', holiday_file), ('guidelines', guidelines_file))
+        if file
+    }
+    if len(bundle_files) > 1 and st.button("Load All Selected", use_container_width=True, disabled=bool(pending_uploads)):
+        start_bundle_upload(bundle_files)
+    poll_bundle_upload()
+    
+    if pending_uploads:
+        watch_uploads()
     
     st.divider()
     
     st.subheader("📊 Data Status")
-    st.markdown(
-        f"<span class='status-pill'>{'✅' if st.session_state['data_loaded']['courses'] else '⚪'} Courses</span>",
-        unsafe_allow_html=True
-    )
-    st.markdown(
-        f"<span class='status-pill'>{'✅' if st.session_state['data_loaded']['holidays'] else '⚪'} Holidays</span>",
-        unsafe_allow_html=True
-    )
-    st.markdown(
-        f"<span class='status-pill'>{'✅' if st.session_state['data_loaded']['guidelines'] else '⚪'} Guidelines</span>",
-        unsafe_allow_html=True
-    )
+    data_loaded = st.session_state['data_loaded']
     document_status = f"✅ {len(st.session_state['available_documents'])}" if st.session_state['documents_loaded'] else "⚪"
+    pill_labels = (
+        f"{'✅' if data_loaded['courses'] else '⚪'} Courses",
+        f"{'✅' if data_loaded['holidays'] else '⚪'} Holidays",
+        f"{'✅' if data_loaded['guidelines'] else '⚪'} Guidelines",
+        f"{document_status} Documents",
+    )
+    # One element for all four pills; blank lines keep them stacked as before
     st.markdown(
-        f"<span class='status-pill'>{document_status} Documents</span>",
+        "\n\n".join(f"<span class='status-pill'>{label}</span>" for label in pill_labels),
         unsafe_allow_html=True
     )
+    if st.button("🔄 Refresh documents", use_container_width=True):
+        fetch_available_documents.clear()
+        st.session_state['documents_loaded'] = False
+        st.rerun()
 
 # --- MAIN CONTENT ---
 st.title("🤖 AI Agent Toolkit for Tata Strive")
 st.caption("Design assessments, lesson plans, and tailored learning content in minutes.")
 
-if not st.session_state['detected_location']:
-    with st.spinner("Detecting location..."):
-        location_data = detect_location()
-        if location_data:
-            st.session_state['detected_location'] = location_data
-
-location_info = st.session_state.get('detected_location', {})
+location_info = st.session_state.get('detected_location') or {}
 detected_loc = location_info.get('location', {})
 suggested_lang = location_info.get('suggested_language', 'English')
 
@@ -233,7 +574,8 @@ tab1, tab2, tab3, tab4 = st.tabs([
 ])
 
 # --- TAB 1: ASSESSMENT CREATOR ---
-with tab1:
+@st.fragment
+def render_assessment_tab():
     st.header("Create a New Assessment")
     
     if not st.session_state['data_loaded']['guidelines']:
@@ -249,7 +591,7 @@ with tab1:
         
         col1, col2 = st.columns(2)
         with col1:
-            default_index = LANGUAGE_OPTIONS.index(suggested_lang) if suggested_lang in LANGUAGE_OPTIONS else 0
+            default_index = LANGUAGE_INDEX.get(suggested_lang, 0)
             assessment_lang = st.selectbox("Language:", LANGUAGE_OPTIONS, index=default_index, key="ass_lang")
         with col2:
             assessment_format = st.radio("Output Format:", ["json", "docx", "pdf"], key="ass_format", horizontal=True)
@@ -259,32 +601,32 @@ with tab1:
                 st.error("❌ Please select at least one source document before generating")
             else:
                 st.session_state['download_info'] = None
-                with st.spinner("Generating your assessment..."):
-                    payload = {
-                        "query": assessment_query, 
-                        "language": assessment_lang, 
-                        "output_format": assessment_format,
-                        "selected_documents": selected_ass_docs
-                    }
-                    result = call_api("/create/assessment", payload)
-                    
-                    if result:
-                        if assessment_format == 'json':
-                            st.success("✅ Assessment generated successfully!")
-                            st.write("### English Version"); st.markdown(result['english_answer'])
-                            if assessment_lang != "English":
-                                st.write(f"### {assessment_lang} Version"); st.markdown(result['translated_answer'])
-                            st.write("#### Sources Used:"); st.write(result['sources'])
-                        else:
-                            st.success("✅ Document generated successfully!")
-                            st.session_state['download_info'] = {"data": result, "file_name": f"assessment.{assessment_format}", "mime": f"application/{'vnd.openxmlformats-officedocument.wordprocessingml.document' if assessment_format == 'docx' else 'pdf'}"}
+                payload = {
+                    "query": assessment_query, 
+                    "language": assessment_lang, 
+                    "output_format": assessment_format,
+                    "selected_documents": selected_ass_docs
+                }
+                result = submit_and_poll("/create/assessment", payload, "Generating your assessment...")
+                
+                if result:
+                    if assessment_format == 'json':
+                        st.success("✅ Assessment generated successfully!")
+                        st.write("### English Version"); st.markdown(result['english_answer'])
+                        if assessment_lang != "English":
+                            st.write(f"### {assessment_lang} Version"); st.markdown(result['translated_answer'])
+                        st.write("#### Sources Used:"); st.write(result['sources'])
+                    else:
+                        st.success("✅ Document generated successfully!")
+                        st.session_state['download_info'] = {"data": result, "file_name": f"assessment.{assessment_format}", "mime": f"application/{'vnd.openxmlformats-officedocument.wordprocessingml.document' if assessment_format == 'docx' else 'pdf'}"}
 
     if st.session_state.get('download_info') and 'assessment' in st.session_state['download_info']['file_name']:
         info = st.session_state['download_info']
         st.download_button(label=f"📥 Download {info['file_name']}", data=info['data'], file_name=info['file_name'], mime=info['mime'], use_container_width=True)
 
 # --- TAB 2: LESSON PLANNER ---
-with tab2:
+@st.fragment
+def render_lesson_plan_tab():
     st.header("Create a New Lesson Plan")
     
     if not st.session_state['data_loaded']['courses']:
@@ -303,12 +645,12 @@ with tab2:
         col1, col2 = st.columns(2)
         with col1:
             lp_course = st.text_input("Course Name (Optional):", "Front Desk Associate", key="lp_course")
-            default_state_index = STATE_OPTIONS.index(detected_loc.get('state')) if detected_loc.get('state') in STATE_OPTIONS else 0
+            default_state_index = STATE_INDEX.get(detected_loc.get('state'), 0)
             lp_state = st.selectbox("State/Location:", STATE_OPTIONS, index=default_state_index, key="lp_state")
         
         with col2:
             lp_start_date = st.date_input("Start Date:", value=datetime.now(), key="lp_start_date")
-            default_lang_index = LANGUAGE_OPTIONS.index(suggested_lang) if suggested_lang in LANGUAGE_OPTIONS else 0
+            default_lang_index = LANGUAGE_INDEX.get(suggested_lang, 0)
             lp_lang = st.selectbox("Language:", LANGUAGE_OPTIONS, index=default_lang_index, key="lp_lang")
         
         lp_format = st.radio("Output Format:", ["json", "docx", "pdf"], key="lp_format", horizontal=True)
@@ -318,36 +660,36 @@ with tab2:
                 st.error("❌ Please select at least one source document before generating")
             else:
                 st.session_state['download_info'] = None
-                with st.spinner("Generating lesson plan..."):
-                    payload = {
-                        "query": lp_query, 
-                        "course_name": lp_course, 
-                        "state": lp_state, 
-                        "start_date": lp_start_date.strftime('%Y-%m-%d'), 
-                        "language": lp_lang, 
-                        "output_format": lp_format,
-                        "selected_documents": selected_lp_docs
-                    }
-                    result = call_api("/create/lesson_plan", payload)
-                    
-                    if result:
-                        if lp_format == 'json':
-                            st.success("✅ Lesson plan generated successfully!")
-                            st.write("### English Version"); st.markdown(result['english_answer'])
-                            if lp_lang != "English":
-                                st.write(f"### {lp_lang} Version"); st.markdown(result['translated_answer'])
-                            st.write("#### Sources Used:"); st.write(result['sources'])
-                            with st.expander("📅 Holidays Considered"): st.text(result['holidays_considered'])
-                        else:
-                            st.success("✅ Document generated successfully!")
-                            st.session_state['download_info'] = {"data": result, "file_name": f"lesson_plan.{lp_format}", "mime": f"application/{'vnd.openxmlformats-officedocument.wordprocessingml.document' if lp_format == 'docx' else 'pdf'}"}
+                payload = {
+                    "query": lp_query, 
+                    "course_name": lp_course, 
+                    "state": lp_state, 
+                    "start_date": lp_start_date.strftime('%Y-%m-%d'), 
+                    "language": lp_lang, 
+                    "output_format": lp_format,
+                    "selected_documents": selected_lp_docs
+                }
+                result = submit_and_poll("/create/lesson_plan", payload, "Generating lesson plan...")
+                
+                if result:
+                    if lp_format == 'json':
+                        st.success("✅ Lesson plan generated successfully!")
+                        st.write("### English Version"); st.markdown(result['english_answer'])
+                        if lp_lang != "English":
+                            st.write(f"### {lp_lang} Version"); st.markdown(result['translated_answer'])
+                        st.write("#### Sources Used:"); st.write(result['sources'])
+                        with st.expander("📅 Holidays Considered"): st.text(result['holidays_considered'])
+                    else:
+                        st.success("✅ Document generated successfully!")
+                        st.session_state['download_info'] = {"data": result, "file_name": f"lesson_plan.{lp_format}", "mime": f"application/{'vnd.openxmlformats-officedocument.wordprocessingml.document' if lp_format == 'docx' else 'pdf'}"}
 
     if st.session_state.get('download_info') and 'lesson_plan' in st.session_state['download_info']['file_name']:
         info = st.session_state['download_info']
         st.download_button(label=f"📥 Download {info['file_name']}", data=info['data'], file_name=info['file_name'], mime=info['mime'], use_container_width=True)
 
 # --- TAB 3: CONTENT GENERATOR ---
-with tab3:
+@st.fragment
+def render_content_tab():
     st.header("🏗️ Build New Learning Content")
     st.markdown("Create facilitator-ready guides, notes, and learner handouts grounded in Tata Strive knowledge.")
     
@@ -371,7 +713,7 @@ with tab3:
         with col2:
             audience = st.text_input("Target Audience:", "Front Desk Associate trainees", key="content_audience")
             length_choice = st.selectbox("Depth:", LENGTH_OPTIONS, index=1, key="content_length")
-            default_lang_index = LANGUAGE_OPTIONS.index(suggested_lang) if suggested_lang in LANGUAGE_OPTIONS else 0
+            default_lang_index = LANGUAGE_INDEX.get(suggested_lang, 0)
             content_lang = st.selectbox("Language:", LANGUAGE_OPTIONS, index=default_lang_index, key="content_lang")
         
         content_format = st.radio("Output Format:", ["json", "docx", "pdf"], key="content_format", horizontal=True)
@@ -383,43 +725,42 @@ with tab3:
                 st.error("❌ Topic cannot be empty")
             else:
                 st.session_state['download_info'] = None
-                with st.spinner("Assembling your content package..."):
-                    payload = {
-                        "query": content_topic.strip(),
-                        "content_type": content_type,
-                        "audience": audience.strip() or "Front Desk Associate trainees",
-                        "tone": tone,
-                        "length": length_choice,
-                        "include_practice": include_practice,
-                        "language": content_lang,
-                        "output_format": content_format,
-                        "selected_documents": selected_content_docs
-                    }
-                    result = call_api("/create/content", payload)
-                    
-                    if result:
-                        if content_format == 'json':
-                            st.success("✅ Content generated successfully!")
-                            st.write("### English Version"); st.markdown(result['english_answer'])
-                            if content_lang != "English":
-                                st.write(f"### {content_lang} Version"); st.markdown(result['translated_answer'])
-                            st.write("#### Sources Used:"); st.write(result['sources'])
-                            metadata = result.get('metadata', {})
-                            if metadata:
-                                st.write("#### Generation Settings:")
-                                st.json(metadata)
-                        else:
-                            st.success("✅ Document generated successfully!")
-                            file_extension = 'docx' if content_format == 'docx' else 'pdf'
-                            mime_type = (
-                                "application/vnd.openxmlformats-officedocument.wordprocessingml.document"
-                                if file_extension == 'docx' else "application/pdf"
-                            )
-                            st.session_state['download_info'] = {
-                                "data": result,
-                                "file_name": f"content.{file_extension}",
-                                "mime": mime_type
-                            }
+                payload = {
+                    "query": content_topic.strip(),
+                    "content_type": content_type,
+                    "audience": audience.strip() or "Front Desk Associate trainees",
+                    "tone": tone,
+                    "length": length_choice,
+                    "include_practice": include_practice,
+                    "language": content_lang,
+                    "output_format": content_format,
+                    "selected_documents": selected_content_docs
+                }
+                result = submit_and_poll("/create/content", payload, "Assembling your content package...")
+                
+                if result:
+                    if content_format == 'json':
+                        st.success("✅ Content generated successfully!")
+                        st.write("### English Version"); st.markdown(result['english_answer'])
+                        if content_lang != "English":
+                            st.write(f"### {content_lang} Version"); st.markdown(result['translated_answer'])
+                        st.write("#### Sources Used:"); st.write(result['sources'])
+                        metadata = result.get('metadata', {})
+                        if metadata:
+                            st.write("#### Generation Settings:")
+                            st.json(metadata)
+                    else:
+                        st.success("✅ Document generated successfully!")
+                        file_extension = 'docx' if content_format == 'docx' else 'pdf'
+                        mime_type = (
+                            "application/vnd.openxmlformats-officedocument.wordprocessingml.document"
+                            if file_extension == 'docx' else "application/pdf"
+                        )
+                        st.session_state['download_info'] = {
+                            "data": result,
+                            "file_name": f"content.{file_extension}",
+                            "mime": mime_type
+                        }
     
     if st.session_state.get('download_info') and 'content' in st.session_state['download_info']['file_name']:
         info = st.session_state['download_info']
@@ -432,7 +773,8 @@ with tab3:
         )
 
 # --- TAB 4: PERSONALIZED LEARNING ---
-with tab4:
+@st.fragment
+def render_personalized_learning_tab():
     st.header("🎯 Automated Personalized Learning System")
     st.markdown("Upload student assessment data and the system will automatically analyze performance, generate personalized study guides, and email PDFs to students who need support.")
     
@@ -447,14 +789,20 @@ with tab4:
         if st.button("🚀 Process & Send Emails", use_container_width=True, type="primary"):
             st.session_state['email_results'] = None
             
-            with st.spinner("⏳ Processing assessment data and sending emails... This may take a few minutes..."):
-                result = upload_file_to_api("/process/assessment_and_email", uploaded_file)
-                
-                if result and 'error' not in result:
-                    st.session_state['email_results'] = result
-                    st.success("✅ Processing Complete!")
-                else:
-                    st.error(f"❌ Processing failed: {result.get('error', 'Unknown error')}")
+            # The batch runs as a backend job; polling keeps every HTTP call short
+            result = submit_file_and_poll(
+                "/process/assessment_and_email",
+                uploaded_file,
+                "⏳ Processing assessment data and sending emails... This may take a few minutes...",
+                expected_seconds=EMAIL_JOB_EXPECTED_SECONDS
+            )
+            
+            if result and 'error' not in result:
+                st.session_state['email_results'] = result
+                st.session_state['email_results_key'] = results_cache_key(result.get('email_results', []))
+                st.success("✅ Processing Complete!")
+            elif result:
+                st.error(f"❌ Processing failed: {result.get('error', 'Unknown error')}")
     
     if st.session_state.get('email_results'):
         results = st.session_state['email_results']
@@ -469,10 +817,13 @@ with tab4:
         st.divider()
         
         st.subheader("📧 Email Delivery Status")
-        email_df = pd.DataFrame(results.get('email_results', []))
-        if not email_df.empty:
-            st.dataframe(email_df.style.applymap(lambda v: 'background-color: #d4edda; color: #155724' if '✅' in str(v) else ('background-color: #f8d7da; color: #721c24' if '❌' in str(v) else ''), subset=['status']), use_container_width=True, hide_index=True)
-            st.download_button("📥 Download Email Report (CSV)", email_df.to_csv(index=False), "email_delivery_report.csv", "text/csv")
+        email_records = results.get('email_results', [])
+        results_key = st.session_state.get('email_results_key') or results_cache_key(email_records)
+        if email_records:
+            # Built once per result set (cached), so reruns only re-apply the vectorised styling
+            email_df = build_email_dataframe(results_key, email_records)
+            st.dataframe(email_df.style.apply(style_status_column, subset=['status']), use_container_width=True, hide_index=True)
+            st.download_button("📥 Download Email Report (CSV)", build_email_csv(results_key, email_records), "email_delivery_report.csv", "text/csv")
         else:
             st.info("ℹ️ No emails needed to be sent (all students scored above 70%).")
         
@@ -485,3 +836,13 @@ with tab4:
             for i, q in enumerate(weak_questions, 1):
                 with st.expander(f"Question {i} - Success Rate: {q['success_rate']:.1f}%"):
                     st.write(q['question'])
+
+# Each tab is a fragment, so its widgets rerun only that tab instead of the whole page
+with tab1:
+    render_assessment_tab()
+with tab2:
+    render_lesson_plan_tab()
+with tab3:
+    render_content_tab()
+with tab4:
+    render_personalized_learning_tab()
@@ -1,24 +1,40 @@
 import os
 import io
-import json
+import bisect
+import orjson
 import re
+import string
+import functools
 import html
+import math
+import multiprocessing
+import queue
+import time
+import uuid
+import threading
 import traceback
+from collections import OrderedDict
 from pathlib import Path
+import numpy as np
 import pandas as pd
 import smtplib
 from email.mime.multipart import MIMEMultipart
 from email.mime.text import MIMEText
 from email.mime.application import MIMEApplication
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 from datetime import datetime, timedelta
 from dotenv import load_dotenv
 from pinecone import Pinecone
 from flask import Flask, request, jsonify, send_file
+from flask.json.provider import DefaultJSONProvider
 from flask_cors import CORS
+from flask_compress import Compress
 from google.cloud import storage
 import vertexai
 from vertexai.language_models import TextEmbeddingModel
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from docx import Document
 from docx.shared import Pt
 from markdown_it import MarkdownIt
@@ -67,17 +83,70 @@ EMAIL_PASSWORD = os.environ.get("EMAIL_SENDER_PASSWORD")
 EMAIL_SENDER_NAME = os.environ.get("EMAIL_SENDER_NAME", "Tata Strive Learning Team")
 SMTP_SERVER = "smtp.gmail.com"
 SMTP_PORT = 587
+EMAIL_SEND_WORKERS = int(os.environ.get("EMAIL_SEND_WORKERS", "4"))
+STUDENT_CONTENT_WORKERS = int(os.environ.get("STUDENT_CONTENT_WORKERS", "8"))
 
 # --- IN-MEMORY DATA STORAGE ---
 course_data = {}  # Will store course duration info
-holiday_data = {}  # Will store holidays by state
+holiday_data = {}  # Will store holidays by state, sorted by date
+holiday_dates = {}  # Sorted holiday dates per state, parallel to holiday_data for bisection
 assessment_guidelines = ""  # Will store assessment guidelines
 
 # --- CLIENT INITIALIZATION ---
 vertexai.init(project=PROJECT_ID, location=LOCATION)
 storage_client = storage.Client()
 embedding_model = TextEmbeddingModel.from_pretrained(EMBEDDING_MODEL)
+
+# Shared keep-alive connection pools for outbound HTTP (OpenRouter, ip-api, Nominatim)
+# so repeated calls skip the TCP/TLS handshake. Status retries only apply to
+# idempotent methods, so generation POSTs are never silently re-sent.
+_http_adapter = HTTPAdapter(
+    pool_connections=8,
+    pool_maxsize=16,
+    max_retries=Retry(total=3, backoff_factor=0.5, status_forcelist=[429, 502, 503, 504])
+)
+# Geolocation lookups have a cheap "not detected" fallback and sit on the page-load
+# path, so they never retry: their timeout is the real upper bound on the wait.
+GEOLOOKUP_URL_PREFIXES = ("http://ip-api.com/", "https://nominatim.openstreetmap.org/")
+_geolookup_adapter = HTTPAdapter(pool_connections=2, pool_maxsize=8, max_retries=0)
+_http_local = threading.local()
+
+def get_http_session() -> requests.Session:
+    """Per-thread Session (Session objects are not thread-safe) over the shared connection pools"""
+    session = getattr(_http_local, "session", None)
+    if session is None:
+        session = requests.Session()
+        session.mount("https://", _http_adapter)
+        session.mount("http://", _http_adapter)
+        # Longest matching prefix wins, so these hosts bypass the retrying adapter
+        for prefix in GEOLOOKUP_URL_PREFIXES:
+            session.mount(prefix, _geolookup_adapter)
+        _http_local.session = session
+    return session
+
+class OrjsonProvider(DefaultJSONProvider):
+    """Serve jsonify() responses through orjson; unsupported types fall back to Flask's encoder"""
+    
+    def dumps(self, obj, **kwargs) -> str:
+        return self._dump_bytes(obj).decode('utf-8')
+    
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+    
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(self._dump_bytes(obj), mimetype=self.mimetype)
+    
+    def _dump_bytes(self, obj) -> bytes:
+        # Datetimes pass through to Flask's default() so they keep the HTTP-date format
+        return orjson.dumps(
+            obj,
+            default=self.default,
+            option=orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_PASSTHROUGH_DATETIME
+        )
+
 app = Flask(__name__)
+app.json = OrjsonProvider(app)
 
 raw_origins = os.environ.get("FRONTEND_ORIGINS", "*")
 if raw_origins == "*":
@@ -93,6 +162,11 @@ CORS(
     methods=["GET", "POST", "OPTIONS"]
 )
 
+# Gzip JSON responses (generated answers, document lists) for clients that accept it
+app.config["COMPRESS_ALGORITHM"] = "gzip"
+app.config["COMPRESS_MIMETYPES"] = ["application/json", "text/plain", "text/html"]
+Compress(app)
+
 markdown_renderer = MarkdownIt("commonmark").enable("table").enable("strikethrough").enable("linkify")
 
 PDF_BASE_STYLE_CSS = """
@@ -215,6 +289,7 @@ _SCRIPT_PATTERNS = {
     "kannada": re.compile(r"[\u0C80-\u0CFF]"),
 }
 _PDF_FONTS_REGISTERED = False
+_PDF_FONTS_LOCK = threading.Lock()
 _AVAILABLE_PDF_FONTS: set[str] = set()
 _PDF_STYLE_CACHE: dict[str, ParagraphStyle] = {}
 
@@ -222,10 +297,15 @@ WEASYPRINT_WARNING_EMITTED = False
 
 
 def _register_pdf_fonts() -> None:
-    global _PDF_FONTS_REGISTERED
     if _PDF_FONTS_REGISTERED:
         return
+    # Study guides are rendered on several threads; register the fonts exactly once
+    with _PDF_FONTS_LOCK:
+        if not _PDF_FONTS_REGISTERED:
+            _register_pdf_fonts_locked()
 
+def _register_pdf_fonts_locked() -> None:
+    global _PDF_FONTS_REGISTERED
     font_files = {
         PDF_FONT_DEFAULT: "NotoSans-Regular.ttf",
         PDF_FONT_BOLD: "NotoSans-Bold.ttf",
@@ -529,9 +609,11 @@ def _render_pdf_with_reportlab(title: str, blocks: list, generated_on: str) -> i
     buffer.seek(0)
     return buffer
 
+_NON_ALNUM_RE = re.compile(r'[^a-z0-9]')
+
 def _normalize_column_key(name: str) -> str:
     """Create a comparable key for loose column matching."""
-    return re.sub(r'[^a-z0-9]', '', str(name).lower())
+    return _NON_ALNUM_RE.sub('', str(name).lower())
 
 def _find_best_column(columns, candidates):
     """Find the first column that matches any candidate alias."""
@@ -553,6 +635,29 @@ def _find_best_column(columns, candidates):
     
     return None
 
+ASSESSMENT_COLUMN_ALIASES = {
+    "attempt": ["Attempt ID", "AttemptID", "Attempt Number", "Attempt", "Submission Time", "Submitted At", "Submitted On"],
+    "login": ["Login ID", "LoginID", "Email", "Student Email", "Learner Email", "User Email", "Email Address", "Username"],
+    "question_id": ["Question ID", "QuestionID", "Question Number", "Question No", "Question Code"],
+    "question_text": ["Question Text", "Question", "Question Statement", "Question Description", "Question Title"],
+    "status": ["Answer Status", "Status", "Result", "Answer Result", "Is Correct", "Outcome", "Response Status"],
+    "marks": ["Obtained Marks", "Score", "Marks Obtained", "Marks", "Points", "Earned Points", "Awarded Score"],
+}
+_ASSESSMENT_COLUMN_KEYS = {
+    _normalize_column_key(alias) for aliases in ASSESSMENT_COLUMN_ALIASES.values() for alias in aliases
+}
+# Lower-cased header names load_course_data / load_holiday_data look for
+COURSE_CSV_COLUMNS = {
+    "name", "course_name", "id", "course_id", "cumulative_course_duration", "time_in_hr",
+    "domain_theory_hours", "eligibility_criteria", "legend",
+}
+HOLIDAY_CSV_COLUMNS = {"location", "state", "region", "holidays", "holiday", "holidaydate", "date", "holidayday", "day"}
+
+def _is_assessment_column(name) -> bool:
+    """usecols filter: keep any column _find_best_column could pick for an assessment field"""
+    key = _normalize_column_key(name)
+    return any(candidate in key for candidate in _ASSESSMENT_COLUMN_KEYS)
+
 def _status_to_flag(value: str) -> str:
     """Map status strings to a normalized correctness flag."""
     text = str(value).strip().lower()
@@ -574,25 +679,43 @@ def _status_to_flag(value: str) -> str:
 print("Initializing Pinecone...")
 pc = Pinecone(api_key=PINECONE_API_KEY)
 pinecone_index = pc.Index(PINECONE_INDEX_NAME)
+# Fans out independent Pinecone queries (e.g. one per weak topic) so they overlap
+rag_query_executor = ThreadPoolExecutor(
+    max_workers=int(os.environ.get("RAG_QUERY_WORKERS", "8")),
+    thread_name_prefix="rag-query"
+)
 print("✅ Pinecone index connection established.")
 
 print(f"Loading metadata from gs://{BUCKET_NAME}/{METADATA_FILE_PATH}...")
 try:
     bucket = storage_client.bucket(BUCKET_NAME)
     blob = bucket.blob(METADATA_FILE_PATH)
-    metadata_lookup = json.loads(blob.download_as_string())
+    # Stream the blob and parse the raw bytes; no intermediate decoded str copy
+    with blob.open('rb') as metadata_file:
+        metadata_lookup = orjson.loads(metadata_file.read())
     print("✅ Metadata loaded successfully.")
 except Exception as e:
     print(f"❌ FATAL: Could not load metadata file. Error: {e}")
     metadata_lookup = {}
 
 # --- LOCATION DETECTION ---
+IP_LOCATION_TTL_SECONDS = 3600
+IP_LOCATION_CACHE_MAX_ENTRIES = 4096
+ip_location_cache = {}  # ip -> (fetched_at, location)
+ip_location_lock = threading.Lock()
+
 def detect_location_from_ip(ip_address: str) -> dict:
-    """Detect location from IP address"""
+    """Detect location from IP address; successful lookups are cached per IP for an hour"""
+    now = time.time()
+    with ip_location_lock:
+        cached = ip_location_cache.get(ip_address)
+        if cached and now - cached[0] < IP_LOCATION_TTL_SECONDS:
+            return dict(cached[1])
+    
     try:
-        response = requests.get(f"http://ip-api.com/json/{ip_address}")
+        response = get_http_session().get(f"http://ip-api.com/json/{ip_address}", timeout=2)
         data = response.json()
-        return {
+        location = {
             "city": data.get("city", ""),
             "state": data.get("regionName", ""),
             "country": data.get("country", "India"),
@@ -600,6 +723,14 @@ def detect_location_from_ip(ip_address: str) -> dict:
         }
     except:
         return {"city": "", "state": "", "country": "India", "detected": False}
+    
+    with ip_location_lock:
+        if len(ip_location_cache) >= IP_LOCATION_CACHE_MAX_ENTRIES:
+            expired = [ip for ip, (fetched_at, _) in ip_location_cache.items() if now - fetched_at >= IP_LOCATION_TTL_SECONDS]
+            for ip in expired or list(ip_location_cache)[:IP_LOCATION_CACHE_MAX_ENTRIES // 4]:
+                del ip_location_cache[ip]
+        ip_location_cache[ip_address] = (now, location)
+    return dict(location)
 
 
 def reverse_geocode(lat: float, lon: float) -> dict:
@@ -612,7 +743,7 @@ def reverse_geocode(lat: float, lon: float) -> dict:
             "lon": float(lon),
             "zoom": 10,
         }
-        response = requests.get(
+        response = get_http_session().get(
             "https://nominatim.openstreetmap.org/reverse",
             params=params,
             headers=headers,
@@ -657,9 +788,7 @@ def load_course_data(file):
     """Load course duration data from CSV"""
     global course_data
     try:
-        df = pd.read_csv(file)
-        if df.empty:
-            raise ValueError("Course CSV is empty")
+        df = pd.read_csv(file, usecols=lambda col: col.lower().strip() in COURSE_CSV_COLUMNS)
 
         # Normalise column names so we can support multiple schema variants
         normalized_columns = {col.lower().strip(): col for col in df.columns}
@@ -674,23 +803,26 @@ def load_course_data(file):
             raise ValueError(
                 "Course CSV missing required columns (expected name/course_name and cumulative_course_duration/time_in_Hr)"
             )
+        # Checked after the columns: usecols leaves no columns (hence an empty frame)
+        # when none of the headers match, and that must report the missing columns
+        if df.empty:
+            raise ValueError("Course CSV is empty")
 
         # Reset existing cache
         course_data.clear()
 
         if "cumulative_course_duration" in normalized_columns:
             # Original compact schema: one row per course with pre-computed aggregates
-            for _, row in df.iterrows():
-                course_name = str(row[course_name_col]).strip()
-                if not course_name:
-                    continue
-
-                course_data[course_name] = {
-                    "id": row[course_id_col] if course_id_col else None,
-                    "duration_hours": float(row.get(duration_col, 0) or 0),
-                    "theory_hours": float(row.get(theory_col, 0) or 0) if theory_col else 0.0,
-                    "eligibility": row.get(eligibility_col, "Not specified") if eligibility_col else "Not specified",
-                }
+            courses = pd.DataFrame({
+                "name": df[course_name_col].astype(str).str.strip(),
+                "id": df[course_id_col] if course_id_col else None,
+                "duration_hours": df[duration_col].astype(float).fillna(0.0),
+                "theory_hours": df[theory_col].astype(float).fillna(0.0) if theory_col else 0.0,
+                "eligibility": df[eligibility_col].fillna("Not specified") if eligibility_col else "Not specified",
+            })
+            # Later rows win for repeated names, as they did when filling the dict row by row
+            courses = courses[courses["name"] != ""].drop_duplicates("name", keep="last")
+            course_data.update(courses.set_index("name").to_dict(orient="index"))
         else:
             # BigQuery export schema: multiple rows per course with per-session hours
             df[duration_col] = pd.to_numeric(df[duration_col], errors="coerce").fillna(0.0)
@@ -734,9 +866,7 @@ def load_holiday_data(file):
     """Load holiday data from CSV"""
     global holiday_data
     try:
-        df = pd.read_csv(file)
-        if df.empty:
-            raise ValueError("Holiday CSV is empty")
+        df = pd.read_csv(file, usecols=lambda col: col.lower().strip() in HOLIDAY_CSV_COLUMNS)
 
         normalized_columns = {col.lower().strip(): col for col in df.columns}
         location_col = (
@@ -750,38 +880,37 @@ def load_holiday_data(file):
 
         if not location_col or not date_col or not name_col:
             raise ValueError("Holiday CSV missing required columns (location/state, holiday name, holiday date)")
+        # After the column check, as for course data: no matching headers is not "empty"
+        if df.empty:
+            raise ValueError("Holiday CSV is empty")
 
         # Parse dates robustly (supports ISO, dd-mm-yyyy, etc.)
         parsed_dates = pd.to_datetime(df[date_col], errors="coerce", dayfirst=True)
         if parsed_dates.isna().all():
             parsed_dates = pd.to_datetime(df[date_col], errors="coerce", dayfirst=False)
 
-        df = df.assign(_parsed_date=parsed_dates).dropna(subset=["_parsed_date"])
+        df = df.assign(_parsed_date=parsed_dates).dropna(subset=["_parsed_date"]).sort_values("_parsed_date", kind="stable")
         holiday_data.clear()
+        holiday_dates.clear()
 
-        for state, group in df.groupby(location_col):
+        # Build every record column in one pass; the weekday name fills in missing days
+        weekday_names = df["_parsed_date"].dt.strftime("%A")
+        if day_col:
+            day_values = df[day_col].astype(str).str.strip().where(df[day_col].notna(), weekday_names)
+        else:
+            day_values = weekday_names
+        holidays = pd.DataFrame({
+            "name": df[name_col].astype(str).str.strip(),
+            "date": df["_parsed_date"],
+            "day": day_values,
+        })
+
+        for state, group in holidays.groupby(df[location_col], sort=False):
             state_name = str(state).strip()
             if not state_name:
                 continue
-
-            holidays_for_state = []
-            for _, row in group.iterrows():
-                holiday_date = row["_parsed_date"].to_pydatetime()
-                holiday_day = (
-                    str(row[day_col]).strip()
-                    if day_col and day_col in row and pd.notna(row[day_col])
-                    else holiday_date.strftime("%A")
-                )
-                holidays_for_state.append(
-                    {
-                        "name": str(row[name_col]).strip(),
-                        "date": holiday_date,
-                        "day": holiday_day,
-                    }
-                )
-
-            if holidays_for_state:
-                holiday_data[state_name] = holidays_for_state
+            holiday_data[state_name] = group.to_dict("records")
+            holiday_dates[state_name] = group["date"].tolist()
 
         print(f"✅ Loaded holidays for {len(holiday_data)} states")
         return {"success": True, "states_loaded": len(holiday_data)}
@@ -794,10 +923,12 @@ def load_assessment_guidelines(content):
     """Load assessment guidelines from text content"""
     global assessment_guidelines
     try:
-        if isinstance(content, bytes):
-            assessment_guidelines = content.decode('utf-8')
+        if isinstance(content, (bytes, bytearray)):
+            assessment_guidelines = content.decode('utf-8', errors='replace')
+        elif isinstance(content, str):
+            assessment_guidelines = content
         else:
-            assessment_guidelines = str(content)
+            raise TypeError(f"Guidelines must be text or bytes, got {type(content).__name__}")
         
         print(f"✅ Loaded assessment guidelines ({len(assessment_guidelines)} chars)")
         return {"success": True, "guidelines_length": len(assessment_guidelines)}
@@ -811,31 +942,50 @@ def get_holidays_between_dates(state: str, start_date: datetime, end_date: datet
     if state not in holiday_data:
         return []
     
-    holidays = []
-    for holiday in holiday_data[state]:
-        if start_date <= holiday['date'] <= end_date:
-            holidays.append(holiday)
-    return holidays
+    dates = holiday_dates[state]
+    lo = bisect.bisect_left(dates, start_date)
+    hi = bisect.bisect_right(dates, end_date)
+    return holiday_data[state][lo:hi]
 
 # --- DOCUMENT DISCOVERY ---
+DOCUMENT_TITLES_TTL_SECONDS = 600
+document_titles_cache = {"titles": None, "loaded_at": 0.0}
+document_titles_lock = threading.Lock()
+
+def _collect_document_titles() -> set:
+    """Unique document titles, read from the chunk metadata already held in memory"""
+    if metadata_lookup:
+        # Same titles the upsert script wrote into the Pinecone metadata
+        return {entry.get('title', 'Unknown') for entry in metadata_lookup.values()}
+    
+    # Metadata file unavailable: fall back to sampling the index itself
+    sample_results = pinecone_index.query(
+        vector=[0.0] * 768,  # Dummy vector
+        top_k=1055,  # Get all records
+        include_metadata=True
+    )
+    titles = set()
+    for match in sample_results.get("matches", []):
+        if 'metadata' in match and 'title' in match['metadata']:
+            titles.add(match['metadata']['title'])
+    return titles
+
+def get_document_titles() -> list:
+    """Sorted document titles, rebuilt at most once per DOCUMENT_TITLES_TTL_SECONDS"""
+    with document_titles_lock:
+        cached = document_titles_cache["titles"]
+        if cached is None or time.time() - document_titles_cache["loaded_at"] > DOCUMENT_TITLES_TTL_SECONDS:
+            cached = sorted(_collect_document_titles())
+            document_titles_cache["titles"] = cached
+            document_titles_cache["loaded_at"] = time.time()
+            print(f"✅ Found {len(cached)} unique documents")
+        return cached
+
 @app.route('/get_documents', methods=['GET'])
 def get_documents():
-    """Fetch all unique document titles from Pinecone"""
+    """Return all unique document titles"""
     try:
-        # Query a sample of vectors to get all unique titles
-        sample_results = pinecone_index.query(
-            vector=[0.0] * 768,  # Dummy vector
-            top_k=1055,  # Get all records
-            include_metadata=True
-        )
-        
-        titles = set()
-        for match in sample_results.get("matches", []):
-            if 'metadata' in match and 'title' in match['metadata']:
-                titles.add(match['metadata']['title'])
-        
-        sorted_titles = sorted(list(titles))
-        print(f"✅ Found {len(sorted_titles)} unique documents")
+        sorted_titles = get_document_titles()
         
         return jsonify({
             "documents": sorted_titles,
@@ -847,6 +997,8 @@ def get_documents():
         traceback.print_exc()
         return jsonify({"error": str(e)}), 500
 
+_SLUG_RE = re.compile(r'[^A-Za-z0-9]+')
+
 @app.route('/create/content', methods=['POST'])
 def create_content():
     """Create educational content based on a topic"""
@@ -891,7 +1043,7 @@ def create_content():
         english_content = call_openrouter(prompt, user_instruction)
         translated_content = translate_text(english_content, language)
         
-        sanitized_slug = re.sub(r'[^A-Za-z0-9]+', '_', topic).strip('_') or "content"
+        sanitized_slug = _SLUG_RE.sub('_', topic).strip('_') or "content"
         document_title = f"{content_type}: {topic}"
         
         if format_type == 'docx':
@@ -929,10 +1081,72 @@ def create_content():
         print(f"Error in create_content: {str(e)}")
         return jsonify({"error": str(e)}), 500
 
+# --- RAG RESULT CACHE ---
+# Pinecone results are reused for near-duplicate query embeddings (repeated weak-student
+# topics, re-submitted prompts). Embeddings are bucketed by random-projection LSH sign
+# bits; a hit needs the same bucket and scope plus cosine similarity >= the threshold.
+RAG_CACHE_MAX_ENTRIES = 1024
+RAG_CACHE_HASH_BITS = 16
+RAG_CACHE_MIN_SIMILARITY = 0.95
+rag_cache = OrderedDict()  # entry_id -> (bucket_key, unit_embedding, (context, sources))
+rag_cache_buckets = {}  # bucket_key -> set of entry_ids
+rag_cache_lock = threading.Lock()
+_rag_cache_projection = None
+_rag_cache_next_id = 0
+
+def _rag_cache_key(query_embedding: list, scope: tuple) -> tuple:
+    """Return (bucket_key, unit_embedding) for an embedding; call with rag_cache_lock held"""
+    global _rag_cache_projection
+    vector = np.asarray(query_embedding, dtype=np.float32)
+    norm = np.linalg.norm(vector)
+    unit = vector / norm if norm else vector
+    if _rag_cache_projection is None or _rag_cache_projection.shape[0] != unit.shape[0]:
+        rng = np.random.default_rng(0)
+        _rag_cache_projection = rng.standard_normal((unit.shape[0], RAG_CACHE_HASH_BITS)).astype(np.float32)
+    bits = (unit @ _rag_cache_projection) > 0
+    return (scope, np.packbits(bits).tobytes()), unit
+
+def _rag_cache_lookup(query_embedding: list, scope: tuple):
+    """Return a cached (context, sources) for a near-identical embedding, or None"""
+    with rag_cache_lock:
+        bucket_key, unit = _rag_cache_key(query_embedding, scope)
+        for entry_id in rag_cache_buckets.get(bucket_key, ()):
+            _, cached_unit, result = rag_cache[entry_id]
+            if float(cached_unit @ unit) >= RAG_CACHE_MIN_SIMILARITY:
+                rag_cache.move_to_end(entry_id)
+                context, sources = result
+                return context, list(sources)
+    return None
+
+def _rag_cache_store(query_embedding: list, scope: tuple, result: tuple) -> None:
+    """Remember a Pinecone result, evicting the least recently used entries"""
+    global _rag_cache_next_id
+    with rag_cache_lock:
+        bucket_key, unit = _rag_cache_key(query_embedding, scope)
+        entry_id = _rag_cache_next_id
+        _rag_cache_next_id += 1
+        rag_cache[entry_id] = (bucket_key, unit, result)
+        rag_cache_buckets.setdefault(bucket_key, set()).add(entry_id)
+        while len(rag_cache) > RAG_CACHE_MAX_ENTRIES:
+            evicted_id, (evicted_bucket, _, _) = rag_cache.popitem(last=False)
+            bucket = rag_cache_buckets[evicted_bucket]
+            bucket.discard(evicted_id)
+            if not bucket:
+                del rag_cache_buckets[evicted_bucket]
+
 # --- CORE LOGIC ---
-def perform_rag(query: str, num_neighbors: int = 5, selected_documents: list = None) -> tuple[str, list]:
-    """Perform RAG search using Pinecone with optional document filtering"""
-    query_embedding = embedding_model.get_embeddings([query])[0].values
+RAG_QUERY_ERROR_CONTEXT = "ERROR: Could not query the vector database."
+
+def _embed_queries(queries: list) -> list:
+    """Embed several queries with a single Vertex AI round-trip"""
+    return [embedding.values for embedding in embedding_model.get_embeddings(list(queries))]
+
+def _query_index(query_embedding: list, num_neighbors: int, selected_documents: list = None) -> tuple[str, list]:
+    """Query Pinecone with an existing embedding and assemble the context and sources"""
+    cache_scope = (num_neighbors, tuple(sorted(selected_documents)) if selected_documents else None)
+    cached = _rag_cache_lookup(query_embedding, cache_scope)
+    if cached is not None:
+        return cached
     
     try:
         # Build filter if documents are specified
@@ -956,21 +1170,107 @@ def perform_rag(query: str, num_neighbors: int = 5, selected_documents: list = N
     except Exception as e:
         print(f"❌ ERROR querying Pinecone: {e}")
         traceback.print_exc()
-        return "ERROR: Could not query the vector database.", []
+        return RAG_QUERY_ERROR_CONTEXT, []
     
-    context = ""
-    sources = []
+    context_parts = []
+    # Insertion-ordered dict: de-duplicates titles while keeping the best-ranked first
+    source_titles = {}
     for match in matches:
         if 'metadata' in match:
-            context += match['metadata'].get('text', '') + "\n---\n"
-            sources.append(match['metadata'].get('title', 'Unknown'))
+            context_parts.append(match['metadata'].get('text', ''))
+            source_titles[match['metadata'].get('title', 'Unknown')] = None
     
+    context = "".join(f"{part}\n---\n" for part in context_parts)
     if not context:
         context = "No relevant content found for the selected documents and query."
-            
-    return context, list(set(sources))
+    
+    sources = list(source_titles)
+    _rag_cache_store(query_embedding, cache_scope, (context, tuple(sources)))
+    return context, sources
+
+# --- EMBEDDING MICRO-BATCHER ---
+# Single-query embeddings from concurrent requests (background jobs, the content pool)
+# are coalesced for up to EMBED_BATCH_WINDOW_SECONDS into one Vertex AI call.
+EMBED_BATCH_MAX = 32
+EMBED_BATCH_WINDOW_SECONDS = 0.01
+embed_requests = queue.Queue()
+_embed_worker_lock = threading.Lock()
+_embed_worker_started = False
+
+def _embed_batch_worker() -> None:
+    """Drain embed_requests in small batches and hand each caller its vector"""
+    while True:
+        batch = [embed_requests.get()]
+        deadline = time.monotonic() + EMBED_BATCH_WINDOW_SECONDS
+        while len(batch) < EMBED_BATCH_MAX:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(embed_requests.get(timeout=remaining))
+            except queue.Empty:
+                break
+        
+        try:
+            vectors = _embed_queries([item["text"] for item in batch])
+            for item, vector in zip(batch, vectors):
+                item["vector"] = vector
+        except Exception as e:
+            for item in batch:
+                item["error"] = e
+        for item in batch:
+            item["done"].set()
+
+def embed_query(text: str) -> list:
+    """Embed one query, sharing a Vertex AI round-trip with any concurrent callers"""
+    global _embed_worker_started
+    if not _embed_worker_started:
+        # Started lazily so the thread lives in the serving process, not an import-time parent
+        with _embed_worker_lock:
+            if not _embed_worker_started:
+                threading.Thread(target=_embed_batch_worker, name="embed-batcher", daemon=True).start()
+                _embed_worker_started = True
+    
+    item = {"text": text, "done": threading.Event()}
+    embed_requests.put(item)
+    item["done"].wait()
+    if "error" in item:
+        raise item["error"]
+    return item["vector"]
+
+@functools.lru_cache(maxsize=512)
+def _perform_rag_cached(normalized_query: str, num_neighbors: int, documents_key: tuple) -> tuple[str, tuple]:
+    """Embedding + Pinecone lookup for a normalised query; failures raise so they are never cached"""
+    query_embedding = embed_query(normalized_query)
+    context, sources = _query_index(query_embedding, num_neighbors, list(documents_key) or None)
+    if context == RAG_QUERY_ERROR_CONTEXT:
+        raise RuntimeError(RAG_QUERY_ERROR_CONTEXT)
+    return context, tuple(sources)
 
-def call_openrouter(system_prompt: str, user_query: str, model: str = RAG_MODEL) -> str:
+def perform_rag(query: str, num_neighbors: int = 5, selected_documents: list = None) -> tuple[str, list]:
+    """Perform RAG search using Pinecone with optional document filtering"""
+    # Repeat queries differing only in case or whitespace skip the embedding and Pinecone calls
+    normalized_query = " ".join(query.split()).lower()
+    documents_key = tuple(sorted(selected_documents)) if selected_documents else ()
+    try:
+        context, sources = _perform_rag_cached(normalized_query, num_neighbors, documents_key)
+    except RuntimeError:
+        return RAG_QUERY_ERROR_CONTEXT, []
+    return context, list(sources)
+
+def perform_rag_many(queries: list, num_neighbors: int = 5, selected_documents: list = None, embeddings: list = None) -> list:
+    """RAG for several queries: one batched embedding call, then concurrent Pinecone queries"""
+    if not queries:
+        return []
+    if embeddings is None:
+        embeddings = _embed_queries(queries)
+    futures = [
+        rag_query_executor.submit(_query_index, embedding, num_neighbors, selected_documents)
+        for embedding in embeddings
+    ]
+    return [future.result() for future in futures]
+
+def call_openrouter(system_prompt: str, user_query: str, model: str = RAG_MODEL, cache_system_prompt: bool = False) -> str:
     """Call OpenRouter API for text generation with better error handling"""
     headers = {
         "Authorization": f"Bearer {OPENROUTER_API_KEY}",
@@ -979,10 +1279,16 @@ def call_openrouter(system_prompt: str, user_query: str, model: str = RAG_MODEL)
         "X-Title": "Tata Strive RAG System"
     }
     
+    system_content = system_prompt
+    if cache_system_prompt:
+        # Explicit cache breakpoint for providers that need one (Anthropic, Gemini);
+        # providers with automatic prefix caching ignore the marker.
+        system_content = [{"type": "text", "text": system_prompt, "cache_control": {"type": "ephemeral"}}]
+    
     data = {
         "model": model,
         "messages": [
-            {"role": "system", "content": system_prompt},
+            {"role": "system", "content": system_content},
             {"role": "user", "content": user_query}
         ],
         "temperature": 0.3,
@@ -991,7 +1297,7 @@ def call_openrouter(system_prompt: str, user_query: str, model: str = RAG_MODEL)
     
     try:
         print(f"🔄 Calling OpenRouter with model: {model}")
-        response = requests.post(
+        response = get_http_session().post(
             f"{OPENROUTER_API_BASE}/chat/completions",
             headers=headers,
             json=data,
@@ -1047,24 +1353,12 @@ def analyze_assessment_csv(df: pd.DataFrame) -> dict:
         if not columns:
             raise ValueError("Assessment file has no columns.")
         
-        attempt_col = _find_best_column(columns, [
-            "Attempt ID", "AttemptID", "Attempt Number", "Attempt", "Submission Time", "Submitted At", "Submitted On"
-        ])
-        login_col = _find_best_column(columns, [
-            "Login ID", "LoginID", "Email", "Student Email", "Learner Email", "User Email", "Email Address", "Username"
-        ])
-        question_id_col = _find_best_column(columns, [
-            "Question ID", "QuestionID", "Question Number", "Question No", "Question Code"
-        ])
-        question_text_col = _find_best_column(columns, [
-            "Question Text", "Question", "Question Statement", "Question Description", "Question Title"
-        ])
-        status_col = _find_best_column(columns, [
-            "Answer Status", "Status", "Result", "Answer Result", "Is Correct", "Outcome", "Response Status"
-        ])
-        marks_col = _find_best_column(columns, [
-            "Obtained Marks", "Score", "Marks Obtained", "Marks", "Points", "Earned Points", "Awarded Score"
-        ])
+        attempt_col = _find_best_column(columns, ASSESSMENT_COLUMN_ALIASES["attempt"])
+        login_col = _find_best_column(columns, ASSESSMENT_COLUMN_ALIASES["login"])
+        question_id_col = _find_best_column(columns, ASSESSMENT_COLUMN_ALIASES["question_id"])
+        question_text_col = _find_best_column(columns, ASSESSMENT_COLUMN_ALIASES["question_text"])
+        status_col = _find_best_column(columns, ASSESSMENT_COLUMN_ALIASES["status"])
+        marks_col = _find_best_column(columns, ASSESSMENT_COLUMN_ALIASES["marks"])
         
         if not login_col:
             raise ValueError("Could not find a student email/login column in the assessment file.")
@@ -1077,26 +1371,41 @@ def analyze_assessment_csv(df: pd.DataFrame) -> dict:
         
         working_df = df.copy()
         
-        # Sort by attempt or submission time to get the latest attempts
+        group_keys = [login_col]
+        question_key = question_id_col or question_text_col
+        if question_key:
+            group_keys.append(question_key)
+        
+        # Keep the latest attempt per (student, question). With a datetime or numeric
+        # attempt column this is one groupby idxmax instead of sorting the whole frame.
+        attempt_order = None
         if attempt_col and attempt_col in working_df:
             try:
                 attempt_values = pd.to_datetime(working_df[attempt_col], errors='coerce')
                 if attempt_values.notna().any():
-                    working_df = working_df.assign(__attempt_sort=attempt_values.fillna(pd.Timestamp.min))
-                    working_df = working_df.sort_values('__attempt_sort')
+                    attempt_order = attempt_values.fillna(pd.Timestamp.min)
                 else:
-                    working_df = working_df.sort_values(attempt_col, na_position='last')
+                    attempt_numbers = pd.to_numeric(working_df[attempt_col], errors='coerce')
+                    if attempt_numbers.notna().any():
+                        # Unparseable attempts count as latest, like na_position='last'
+                        attempt_order = attempt_numbers.fillna(float('inf'))
             except Exception:
+                attempt_order = None
+            
+            if attempt_order is not None:
+                # idxmax keeps the first maximum, so scan bottom-up: among equal attempt
+                # keys (e.g. two attempts on one date) the later row in the file wins
+                reversed_order = attempt_order.iloc[::-1]
+                latest_idx = reversed_order.groupby(
+                    [working_df[key].iloc[::-1] for key in group_keys], sort=False
+                ).idxmax()
+                working_df = working_df.loc[np.sort(latest_idx.to_numpy())]
+            else:
                 working_df = working_df.sort_values(attempt_col, na_position='last')
+                working_df = working_df.groupby(group_keys, as_index=False).tail(1)
         else:
+            # No attempt column: the last row in file order wins
             working_df = working_df.reset_index(drop=True)
-        
-        group_keys = [login_col]
-        question_key = question_id_col or question_text_col
-        if question_key:
-            group_keys.append(question_key)
-        
-        if group_keys:
             working_df = working_df.groupby(group_keys, as_index=False).tail(1)
         
         # Prepare marks and status flags
@@ -1130,24 +1439,25 @@ def analyze_assessment_csv(df: pd.DataFrame) -> dict:
         
         question_display_col = question_text_col or question_id_col
         
-        student_details = []
-        for student in weak_students:
-            student_email = student['student_id']
-            failed_rows = working_df[
-                (working_df[login_col] == student_email) &
-                (working_df['__status_norm'] != "correct")
-            ]
-            
-            if failed_rows.empty:
-                continue
-            
-            failed_questions = failed_rows[question_display_col].astype(str).tolist()
-            student_details.append({
-                "email": student_email,
+        # One pass over the failed rows instead of a boolean mask per weak student
+        failed_map = (
+            working_df.loc[working_df['__status_norm'] != "correct", question_display_col]
+            .astype(str)
+            .groupby(working_df[login_col], sort=False)
+            .agg(list)
+            .to_dict()
+        )
+        
+        student_details = [
+            {
+                "email": student['student_id'],
                 "score": f"{int(student['total_marks'])}/{int(student['total_questions'])}",
                 "percentage": round(student['percentage'], 1),
-                "failed_questions": failed_questions
-            })
+                "failed_questions": failed_map[student['student_id']]
+            }
+            for student in weak_students
+            if student['student_id'] in failed_map
+        ]
         
         question_performance = working_df.groupby(question_display_col).agg(
             success_rate=pd.NamedAgg(
@@ -1170,39 +1480,67 @@ def analyze_assessment_csv(df: pd.DataFrame) -> dict:
         traceback.print_exc()
         return {"error": str(e)}
 
+TOPIC_KEYWORDS = {
+    'hotel': 'hotel definition and types',
+    'restaurant': 'restaurant and food service',
+    'hospitality': 'hospitality industry basics',
+    'sarai': 'traditional accommodation types in India',
+    'dharamshala': 'traditional accommodation types in India',
+    'front office': 'front office department and management',
+    'city hotels': 'hotel classifications and types',
+    'thinnai': 'traditional Indian hospitality culture',
+    'independence': 'history of hotel industry in India',
+    'boat houses': 'resort hotels and specialized accommodations',
+    'dal lake': 'resort hotels and specialized accommodations'
+}
+_TOPIC_LIST = list(TOPIC_KEYWORDS.values())
+DEFAULT_STUDY_TOPIC = "Front Desk Associate hospitality basics"
+# Every query extract_topic_from_question() can return; their embeddings never change
+STUDY_TOPIC_QUERIES = tuple(dict.fromkeys(
+    [f"Front Desk Associate {topic}" for topic in _TOPIC_LIST] + [DEFAULT_STUDY_TOPIC]
+))
+study_topic_embeddings = {}
+study_topic_lock = threading.Lock()
+_TAG_RE = re.compile(r'<[^>]+>')
+_SELECT_OPTION_RE = re.compile(r'Select the correct option\..*$')
+_QUESTION_TAIL_RE = re.compile(r'\?.*$')
+# One lookahead per keyword, tried in dict order from the start of the text, so the
+# first keyword in TOPIC_KEYWORDS wins (not the first one to appear in the question).
+_TOPIC_KEYWORD_RE = re.compile(
+    r'^(?:' + '|'.join(f'(?=.*?({re.escape(keyword)}))' for keyword in TOPIC_KEYWORDS) + ')',
+    re.DOTALL
+)
+
+@functools.lru_cache(maxsize=1024)
 def extract_topic_from_question(question_text: str) -> str:
     """Extract key topic from question text for RAG search"""
-    clean_text = re.sub(r'<[^>]+>', '', question_text)
+    clean_text = _TAG_RE.sub('', question_text)
     clean_text = clean_text.replace('<DOUBLE_QUOTES>', '"')
     clean_text = clean_text.replace('<COMMA>', ',')
     clean_text = clean_text.replace('<br>', ' ')
-    clean_text = re.sub(r'Select the correct option\..*$', '', clean_text)
-    clean_text = re.sub(r'\?.*$', '', clean_text)
-    
-    keywords_map = {
-        'hotel': 'hotel definition and types',
-        'restaurant': 'restaurant and food service',
-        'hospitality': 'hospitality industry basics',
-        'sarai': 'traditional accommodation types in India',
-        'dharamshala': 'traditional accommodation types in India',
-        'front office': 'front office department and management',
-        'city hotels': 'hotel classifications and types',
-        'thinnai': 'traditional Indian hospitality culture',
-        'independence': 'history of hotel industry in India',
-        'boat houses': 'resort hotels and specialized accommodations',
-        'dal lake': 'resort hotels and specialized accommodations'
-    }
+    clean_text = _SELECT_OPTION_RE.sub('', clean_text)
+    clean_text = _QUESTION_TAIL_RE.sub('', clean_text)
     
-    clean_lower = clean_text.lower()
-    for keyword, topic in keywords_map.items():
-        if keyword in clean_lower:
-            return f"Front Desk Associate {topic}"
+    match = _TOPIC_KEYWORD_RE.search(clean_text.lower())
+    if match:
+        return f"Front Desk Associate {_TOPIC_LIST[match.lastindex - 1]}"
     
-    return "Front Desk Associate hospitality basics"
-
+    return DEFAULT_STUDY_TOPIC
+
+def _embed_study_topics(topics: list) -> list:
+    """Embeddings for study topics; the fixed topic set is embedded once, in one batch, on first use"""
+    with study_topic_lock:
+        if not study_topic_embeddings:
+            study_topic_embeddings.update(zip(STUDY_TOPIC_QUERIES, _embed_queries(STUDY_TOPIC_QUERIES)))
+    missing = [topic for topic in topics if topic not in study_topic_embeddings]
+    extra = dict(zip(missing, _embed_queries(missing))) if missing else {}
+    return [study_topic_embeddings.get(topic) or extra[topic] for topic in topics]
+
+# Students sit the same assessment, so the same question text recurs across the batch
+@functools.lru_cache(maxsize=1024)
 def clean_question_text(question_text: str) -> str:
     """Clean question text for display"""
-    clean = re.sub(r'<[^>]+>', '', question_text)
+    clean = _TAG_RE.sub('', question_text)
     clean = clean.replace('<DOUBLE_QUOTES>', '"')
     clean = clean.replace('<COMMA>', ',')
     clean = clean.replace('<br>', ' ')
@@ -1213,23 +1551,20 @@ def clean_question_text(question_text: str) -> str:
 def generate_personalized_content_for_student(student_email: str, failed_questions: list) -> str:
     """Generate personalized study content for a student"""
     topics = [extract_topic_from_question(q) for q in failed_questions]
-    weak_topics = ", ".join(set(topics))
+    # Sorted so students with the same weak topics get a byte-identical prompt prefix
+    unique_topics = sorted(set(topics))
+    weak_topics = ", ".join(unique_topics)
     
-    all_context = ""
-    for topic in set(topics):
-        context, _ = perform_rag(topic, num_neighbors=3)
-        all_context += context + "\n\n"
+    all_context = "".join(
+        f"{context}\n\n" for context, _ in perform_rag_many(
+            unique_topics, num_neighbors=3, embeddings=_embed_study_topics(unique_topics)
+        )
+    )
     
-    prompt = f"""You are an expert educator creating personalized remedial content for a Tata Strive Front Desk Associate student.
-
-Student: {student_email}
-Topics they struggled with: {weak_topics}
-
-Questions they got wrong:
-{chr(10).join([f"- {q}" for q in failed_questions])}
-
-Context from knowledge base:
-{all_context}
+    # Static instructions and the shared knowledge-base context go first (system
+    # prompt) so provider-side prefix caching can reuse them across students; the
+    # per-student details follow in the user message.
+    system_prompt = f"""You are an expert educator creating personalized remedial content for a Tata Strive Front Desk Associate student.
 
 Create a comprehensive study guide that:
 1. Explains each concept in simple, clear language
@@ -1239,20 +1574,38 @@ Create a comprehensive study guide that:
 5. Adds 5 practice questions with detailed explanations
 6. Uses encouraging, supportive tone
 
-Focus on helping them understand these specific topics better."""
+Focus on helping them understand these specific topics better.
+
+Context from knowledge base:
+{all_context}"""
     
-    content = call_openrouter(prompt, "Generate personalized study guide")
+    failed_list = "\n".join(f"- {q}" for q in failed_questions)
+    user_query = f"""Generate personalized study guide
+
+Student: {student_email}
+Topics they struggled with: {weak_topics}
+
+Questions they got wrong:
+{failed_list}"""
+    
+    content = call_openrouter(system_prompt, user_query, cache_system_prompt=True)
     return content
 
-def send_email_with_pdf(to_email: str, subject: str, body_plain: str, body_html: str, pdf_content: bytes, pdf_name: str) -> bool:
-    """Send multipart email with PDF attachment using Gmail SMTP"""
+def open_smtp_connection() -> smtplib.SMTP:
+    """Open an authenticated Gmail SMTP connection"""
+    server = smtplib.SMTP(SMTP_SERVER, SMTP_PORT, timeout=60)
+    server.starttls()
+    server.login(EMAIL_SENDER, EMAIL_PASSWORD)
+    return server
+
+def close_smtp_connection(server: smtplib.SMTP) -> None:
+    """Politely close an SMTP connection, ignoring one that has already dropped"""
     try:
-        msg = MIMEMultipart('alternative')
-        msg['From'] = f"{EMAIL_SENDER_NAME} <{EMAIL_SENDER}>"
-        msg['To'] = to_email
-        msg['Subject'] = subject
-        
-        html_body = f"""
+        server.quit()
+    except Exception:
+        server.close()
+
+EMAIL_HTML_LAYOUT = string.Template("""
         <html>
         <body style="font-family: Arial, sans-serif; line-height: 1.6; color: #333;">
             <div style="max-width: 600px; margin: 0 auto; padding: 20px;">
@@ -1260,7 +1613,7 @@ def send_email_with_pdf(to_email: str, subject: str, body_plain: str, body_html:
                 
                 <p>You recently completed the <strong>Front Desk Associate</strong> assessment.</p>
                 
-                {body_html}
+                $body_html
                 
                 <div style="margin-top: 30px; padding-top: 20px; border-top: 1px solid #ddd; color: #666; font-size: 12px;">
                     <p>This is an automated message from Tata Strive Learning Platform.</p>
@@ -1268,7 +1621,18 @@ def send_email_with_pdf(to_email: str, subject: str, body_plain: str, body_html:
             </div>
         </body>
         </html>
-        """
+        """)
+
+def send_email_with_pdf(to_email: str, subject: str, body_plain: str, body_html: str, pdf_content: bytes, pdf_name: str, server: smtplib.SMTP = None) -> bool:
+    """Send multipart email with PDF attachment using Gmail SMTP, over `server` if one is given"""
+    reuse_connection = server is not None
+    try:
+        msg = MIMEMultipart('alternative')
+        msg['From'] = f"{EMAIL_SENDER_NAME} <{EMAIL_SENDER}>"
+        msg['To'] = to_email
+        msg['Subject'] = subject
+        
+        html_body = EMAIL_HTML_LAYOUT.substitute(body_html=body_html)
         
         msg.attach(MIMEText(body_plain, 'plain'))
         msg.attach(MIMEText(html_body, 'html'))
@@ -1277,14 +1641,24 @@ def send_email_with_pdf(to_email: str, subject: str, body_plain: str, body_html:
         pdf_attachment.add_header('Content-Disposition', 'attachment', filename=pdf_name)
         msg.attach(pdf_attachment)
         
-        with smtplib.SMTP(SMTP_SERVER, SMTP_PORT) as server:
-            server.starttls()
-            server.login(EMAIL_SENDER, EMAIL_PASSWORD)
+        if server is None:
+            with smtplib.SMTP(SMTP_SERVER, SMTP_PORT) as server:
+                server.starttls()
+                server.login(EMAIL_SENDER, EMAIL_PASSWORD)
+                server.send_message(msg)
+        else:
             server.send_message(msg)
         
         print(f"✅ Email sent successfully to {to_email}")
         return True
         
+    except smtplib.SMTPServerDisconnected as e:
+        if reuse_connection:
+            # A caller-provided connection went stale; the caller reconnects and resends
+            raise
+        print(f"❌ Failed to send email to {to_email}: {str(e)}")
+        traceback.print_exc()
+        return False
     except Exception as e:
         print(f"❌ Failed to send email to {to_email}: {str(e)}")
         traceback.print_exc()
@@ -1354,6 +1728,11 @@ Create content that:
 Keep the language encouraging, inclusive, and aligned with Tata Strive's methodology."""
 
 # --- DOCUMENT GENERATION ---
+_HEADING_RE = re.compile(r'^(#{1,6})\s+(.*)$')
+_NUMBERED_RE = re.compile(r'^(\d+)[\.\)]\s+(.*)$')
+_HTML_TAG_RE = re.compile(r"<[^>]+>")
+_TABLE_DIVIDER_RE = re.compile(r':?-{3,}:?')
+
 def _parse_structured_content(content: str) -> list:
     """Convert Markdown-like text into structured blocks for export."""
     text_content = _ensure_text(content)
@@ -1370,9 +1749,6 @@ def _parse_structured_content(content: str) -> list:
             blocks.append(_build_table_block(table_buffer))
             table_buffer = []
     
-    heading_pattern = re.compile(r'^(#{1,6})\s+(.*)$')
-    numbered_pattern = re.compile(r'^(\d+)[\.\)]\s+(.*)$')
-    
     for raw_line in lines:
         line = raw_line.rstrip()
         stripped = line.strip()
@@ -1390,7 +1766,7 @@ def _parse_structured_content(content: str) -> list:
             table_buffer.append(stripped)
             continue
         
-        heading_match = heading_pattern.match(stripped)
+        heading_match = _HEADING_RE.match(stripped)
         if heading_match:
             level = len(heading_match.group(1))
             text = heading_match.group(2).strip()
@@ -1402,7 +1778,7 @@ def _parse_structured_content(content: str) -> list:
             blocks.append({"type": "bullet", "text": text})
             continue
         
-        numbered_match = numbered_pattern.match(stripped)
+        numbered_match = _NUMBERED_RE.match(stripped)
         if numbered_match:
             text = numbered_match.group(2).strip()
             blocks.append({"type": "numbered", "text": text})
@@ -1426,7 +1802,7 @@ def _build_table_block(lines: list) -> dict:
     body = rows
     if len(rows) >= 2:
         divider_candidates = rows[1]
-        if all(re.fullmatch(r':?-{3,}:?', cell.replace(' ', '')) for cell in divider_candidates):
+        if all(_TABLE_DIVIDER_RE.fullmatch(cell.replace(' ', '')) for cell in divider_candidates):
             header = rows[0]
             body = rows[2:]
 
@@ -1434,12 +1810,6 @@ def _build_table_block(lines: list) -> dict:
     return {"type": "table", "header": header, "rows": body, "cols": col_count}
 
 
-def _clear_paragraph(paragraph) -> None:
-    """Remove all existing runs from a python-docx paragraph."""
-    for run in list(paragraph.runs):
-        paragraph._p.remove(run._r)
-
-
 def _add_markdown_runs(paragraph, text: str, *, default_bold: bool = False) -> None:
     """Render lightweight markdown emphasis into docx runs without leaving raw markers."""
     content = html.unescape(_ensure_text(text))
@@ -1506,7 +1876,6 @@ def generate_docx(content: str, title: str) -> io.BytesIO:
     """Generate a styled DOCX document from structured content."""
     doc = Document()
     cover_heading = doc.add_heading(level=0)
-    _clear_paragraph(cover_heading)
     _add_markdown_runs(cover_heading, title or "Generated Document", default_bold=True)
     
     try:
@@ -1518,6 +1887,13 @@ def generate_docx(content: str, title: str) -> io.BytesIO:
     
     blocks = _parse_structured_content(str(content))
     
+    # Resolve styles once per document rather than by name for every paragraph.
+    # Paragraphs created below start without runs, so they need no clearing.
+    styles = doc.styles
+    heading_styles = {}
+    bullet_style = styles["List Bullet"]
+    numbered_style = styles["List Number"]
+    
     for block in blocks:
         block_type = block.get("type")
         if block_type == "heading":
@@ -1527,20 +1903,18 @@ def generate_docx(content: str, title: str) -> io.BytesIO:
             except (TypeError, ValueError):
                 level = 1
             level = max(1, min(level, 4))
-            heading_para = doc.add_heading(level=level)
-            _clear_paragraph(heading_para)
+            if level not in heading_styles:
+                heading_styles[level] = styles[f"Heading {level}"]
+            heading_para = doc.add_paragraph(style=heading_styles[level])
             _add_markdown_runs(heading_para, block.get("text", ""), default_bold=True)
         elif block_type == "paragraph":
             para = doc.add_paragraph()
-            _clear_paragraph(para)
             _add_markdown_runs(para, block.get("text", ""))
         elif block_type == "bullet":
-            para = doc.add_paragraph(style="List Bullet")
-            _clear_paragraph(para)
+            para = doc.add_paragraph(style=bullet_style)
             _add_markdown_runs(para, block.get("text", ""))
         elif block_type == "numbered":
-            para = doc.add_paragraph(style="List Number")
-            _clear_paragraph(para)
+            para = doc.add_paragraph(style=numbered_style)
             _add_markdown_runs(para, block.get("text", ""))
         elif block_type == "table":
             header = [_ensure_text(cell) for cell in block.get("header", [])]
@@ -1563,21 +1937,18 @@ def generate_docx(content: str, title: str) -> io.BytesIO:
                 table.style = "Light Shading Accent 1"
             except Exception:
                 pass
+            table_rows = list(table.rows)
             row_idx = 0
             if header:
-                hdr_cells = table.rows[0].cells
+                hdr_cells = table_rows[0].cells
                 for idx in range(min(cols, len(header))):
-                    paragraph = hdr_cells[idx].paragraphs[0]
-                    _clear_paragraph(paragraph)
-                    _add_markdown_runs(paragraph, header[idx], default_bold=True)
+                    _add_markdown_runs(hdr_cells[idx].paragraphs[0], header[idx], default_bold=True)
                 row_idx = 1
             for data_row in rows:
-                cells = table.rows[row_idx].cells
+                cells = table_rows[row_idx].cells
                 for idx in range(cols):
                     text = data_row[idx] if idx < len(data_row) else ""
-                    paragraph = cells[idx].paragraphs[0]
-                    _clear_paragraph(paragraph)
-                    _add_markdown_runs(paragraph, text)
+                    _add_markdown_runs(cells[idx].paragraphs[0], text)
                 row_idx += 1
             doc.add_paragraph("")
         elif block_type == "blank":
@@ -1667,7 +2038,7 @@ def _render_plain_pdf_fallback(title: str, generated_on: str, body_text: str) ->
     safe_body = _ensure_text(body_text)
 
     rendered_html = markdown_renderer.render(safe_body)
-    plain_body = re.sub(r"<[^>]+>", "\n", rendered_html)
+    plain_body = _HTML_TAG_RE.sub("\n", rendered_html)
     plain_body = html.unescape(plain_body)
 
     pdf.setFillColor(colors.HexColor('#005b99'))
@@ -1680,23 +2051,25 @@ def _render_plain_pdf_fallback(title: str, generated_on: str, body_text: str) ->
     pdf.drawString(margin_x, y, f"Generated on: {safe_generated}")
     y -= 18
 
-    pdf.setFillColor(colors.HexColor('#1f2933'))
-    pdf.setFont(PDF_FONT_DEFAULT if _PDF_FONTS_REGISTERED else "Helvetica", 11)
+    body_font = PDF_FONT_DEFAULT if _PDF_FONTS_REGISTERED else "Helvetica"
     line_height = 14
     min_y = margin_y
+    lines = [line.strip() for line in plain_body.splitlines()]
 
-    for line in plain_body.splitlines():
+    # Emit each page's lines as one text object instead of a drawString per line
+    start = 0
+    while start < len(lines):
         if y <= min_y:
             pdf.showPage()
             y = height - margin_y
-            pdf.setFillColor(colors.HexColor('#1f2933'))
-            pdf.setFont(PDF_FONT_DEFAULT if _PDF_FONTS_REGISTERED else "Helvetica", 11)
-        stripped = line.strip()
-        if not stripped:
-            y -= line_height
-            continue
-        pdf.drawString(margin_x, y, stripped)
-        y -= line_height
+        lines_on_page = math.ceil((y - min_y) / line_height)
+        text = pdf.beginText(margin_x, y)
+        text.setFont(body_font, 11, leading=line_height)
+        text.setFillColor(colors.HexColor('#1f2933'))
+        text.textLines(lines[start:start + lines_on_page])
+        pdf.drawText(text)
+        start += lines_on_page
+        y = min_y
 
     pdf.save()
     buffer.seek(0)
@@ -1784,6 +2157,29 @@ def upload_guidelines():
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
+REFERENCE_LOADERS = {
+    'courses': load_course_data,
+    'holidays': load_holiday_data,
+    'guidelines': lambda file: load_assessment_guidelines(file.read()),
+}
+
+@app.route('/upload/reference_bundle', methods=['POST'])
+def upload_reference_bundle():
+    """Upload any of the course, holiday and guideline files in a single request"""
+    try:
+        kinds = [kind for kind in REFERENCE_LOADERS if kind in request.files]
+        if not kinds:
+            return jsonify({"error": "No file uploaded"}), 400
+        
+        # Per-file outcomes are reported individually, so one bad file does not hide the others
+        results = {kind: REFERENCE_LOADERS[kind](request.files[kind]) for kind in kinds}
+        return jsonify({
+            "success": all(result.get('success') for result in results.values()),
+            "results": results
+        }), 200
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
 @app.route('/create/assessment', methods=['POST'])
 def create_assessment():
     """Create an assessment based on a topic"""
@@ -1911,7 +2307,244 @@ def create_lesson_plan():
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
+# --- BACKGROUND JOBS ---
+# Long generations run on a worker pool so clients can submit, poll, and fetch the
+# result instead of holding one HTTP request open for the whole LLM round-trip.
+# Job state is per process; run a single gunicorn worker (the default) to keep it shared.
+JOB_WORKERS = int(os.environ.get("JOB_WORKERS", "4"))
+JOB_RESULT_TTL_SECONDS = 3600
+job_executor = ThreadPoolExecutor(max_workers=JOB_WORKERS, thread_name_prefix="job")
+jobs = {}  # job_id -> status, timestamps and captured response
+jobs_lock = threading.Lock()
+
+def _prune_finished_jobs() -> None:
+    """Drop finished jobs older than the TTL; results that are collected are removed on collection"""
+    cutoff = time.time() - JOB_RESULT_TTL_SECONDS
+    with jobs_lock:
+        expired = [job_id for job_id, job in jobs.items() if job['finished_at'] and job['finished_at'] < cutoff]
+        for job_id in expired:
+            del jobs[job_id]
+
+def _run_job(job_id: str, view_func, request_kwargs: dict) -> None:
+    """Run a view function against a synthetic request and store its full response"""
+    with jobs_lock:
+        jobs[job_id]['status'] = 'running'
+    try:
+        with app.test_request_context(**request_kwargs):
+            response = app.make_response(view_func())
+            response.direct_passthrough = False
+            outcome = {
+                "status": "done" if response.status_code < 400 else "failed",
+                "status_code": response.status_code,
+                "mimetype": response.mimetype,
+                "content_disposition": response.headers.get('Content-Disposition'),
+                "body": response.get_data()
+            }
+    except Exception as e:
+        print(f"❌ Job {job_id} failed: {e}")
+        traceback.print_exc()
+        outcome = {
+            "status": "failed",
+            "status_code": 500,
+            "mimetype": "application/json",
+            "content_disposition": None,
+            "body": orjson.dumps({"error": str(e)})
+        }
+    outcome['finished_at'] = time.time()
+    with jobs_lock:
+        jobs[job_id].update(outcome)
+
+def submit_job(view_func, **request_kwargs) -> str:
+    """Queue a view function for background execution and return its job id"""
+    _prune_finished_jobs()
+    job_id = uuid.uuid4().hex
+    with jobs_lock:
+        jobs[job_id] = {"status": "queued", "created_at": time.time(), "finished_at": None}
+    job_executor.submit(_run_job, job_id, view_func, request_kwargs)
+    return job_id
+
+@app.route('/create/assessment/submit', methods=['POST'])
+def submit_assessment():
+    """Queue assessment generation and return a job id"""
+    job_id = submit_job(create_assessment, path='/create/assessment', method='POST', json=request.get_json(silent=True) or {})
+    return jsonify({"job_id": job_id, "status": "queued"}), 202
+
+@app.route('/create/lesson_plan/submit', methods=['POST'])
+def submit_lesson_plan():
+    """Queue lesson plan generation and return a job id"""
+    job_id = submit_job(create_lesson_plan, path='/create/lesson_plan', method='POST', json=request.get_json(silent=True) or {})
+    return jsonify({"job_id": job_id, "status": "queued"}), 202
+
+@app.route('/create/content/submit', methods=['POST'])
+def submit_content():
+    """Queue content generation and return a job id"""
+    job_id = submit_job(create_content, path='/create/content', method='POST', json=request.get_json(silent=True) or {})
+    return jsonify({"job_id": job_id, "status": "queued"}), 202
+
+@app.route('/jobs/<job_id>', methods=['GET'])
+def get_job_status(job_id):
+    """Report the status of a background job"""
+    _prune_finished_jobs()
+    with jobs_lock:
+        job = jobs.get(job_id)
+        if job is None:
+            return jsonify({"error": "Unknown job id"}), 404
+        return jsonify({"job_id": job_id, "status": job['status']}), 200
+
+@app.route('/jobs/<job_id>/result', methods=['GET'])
+def get_job_result(job_id):
+    """Return the captured response of a finished background job, then forget the job"""
+    _prune_finished_jobs()
+    with jobs_lock:
+        job = jobs.get(job_id)
+        if job is None:
+            return jsonify({"error": "Unknown job id"}), 404
+        if job['status'] in ('queued', 'running'):
+            return jsonify({"error": "Job has not finished yet", "status": job['status']}), 409
+        # Results are collected once; holding the PDF/DOCX/JSON body until the TTL only wastes memory
+        del jobs[job_id]
+    
+    response = app.response_class(job['body'], status=job['status_code'], mimetype=job['mimetype'])
+    if job['content_disposition']:
+        response.headers['Content-Disposition'] = job['content_disposition']
+    return response
+
 # --- PERSONALIZED LEARNING ENDPOINT ---
+# WeasyPrint layout is CPU-bound Python, so study guides rendered on the content
+# threads serialise on the GIL. PDF_PROCESS_WORKERS > 0 moves rendering into worker
+# processes. They are spawned, never forked: by this point the Vertex AI, Pinecone and
+# GCS clients (gRPC threads included) already exist, and the executor also starts
+# replacement workers from request threads, so a fork could copy held locks.
+# Each worker imports this module once when it starts (client set-up included);
+# the parent_process() check keeps the workers from creating pools of their own.
+PDF_PROCESS_WORKERS = int(os.environ.get("PDF_PROCESS_WORKERS", "0"))
+pdf_process_pool = None
+if PDF_PROCESS_WORKERS > 0 and multiprocessing.parent_process() is None:
+    pdf_process_pool = ProcessPoolExecutor(
+        max_workers=PDF_PROCESS_WORKERS,
+        mp_context=multiprocessing.get_context("spawn")
+    )
+
+STUDY_GUIDE_EMAIL_HTML = string.Template("""
+    <div style="background-color: #f8f9fa; padding: 20px; border-radius: 5px; margin: 20px 0;">
+        <h3 style="color: #2c3e50; margin-top: 0;">📊 YOUR RESULTS:</h3>
+        <p style="font-size: 18px;"><strong>Score:</strong> $score ($percentage%)</p>
+        <p style="color: #e74c3c;"><strong>Status:</strong> Needs Improvement</p>
+    </div>
+    <p>We've analyzed your performance and created a personalized study guide to help you master the concepts you found challenging.</p>
+    <div style="background-color: #fff3cd; padding: 15px; border-left: 4px solid #ffc107; margin: 20px 0;">
+        <h4 style="color: #856404; margin-top: 0;">⚠️ TOPICS YOU STRUGGLED WITH:</h4>
+        <ul style="color: #856404;">
+            $topics_html
+        </ul>
+    </div>
+    <div style="background-color: #d4edda; padding: 15px; border-radius: 5px; margin: 20px 0;">
+        <h4 style="color: #155724; margin-top: 0;">📎 ATTACHED: Your_Personalized_Study_Guide.pdf</h4>
+        <p style="color: #155724; margin-bottom: 10px;"><strong>This guide includes:</strong></p>
+        <ul style="color: #155724;">
+            <li>Clear explanations of each topic</li>
+            <li>Practical examples for Front Desk work</li>
+            <li>Memory tips and tricks</li>
+            <li>Practice questions with answers</li>
+        </ul>
+    </div>
+    <p style="background-color: #e3f2fd; padding: 10px; border-left: 4px solid #2196f3; margin: 20px 0;">
+        <strong>💡 TIP:</strong> Review this guide before your next attempt!
+    </p>
+    <p style="margin-top: 30px;">Best regards,<br><strong>$sender_name</strong></p>
+    """)
+
+def _prepare_student_email(student: dict) -> dict:
+    """Generate a student's study guide PDF and email bodies, ready for send_email_with_pdf"""
+    student_email = student['email']
+    failed_questions = student['failed_questions']
+    score = student['score']
+    percentage = student['percentage']
+    
+    print(f"Generating content for {student_email}...")
+    
+    content = generate_personalized_content_for_student(student_email, failed_questions)
+    
+    pdf_title = f"Personalized Study Guide - {student_email}"
+    if pdf_process_pool is not None:
+        pdf_buffer = pdf_process_pool.submit(generate_pdf, content, pdf_title).result()
+    else:
+        pdf_buffer = generate_pdf(content, pdf_title)
+    pdf_bytes = pdf_buffer.getvalue()
+    
+    cleaned_questions = [clean_question_text(q) for q in failed_questions[:5]]
+    topics_plain = "\n".join(f"- {q}" for q in cleaned_questions)
+    topics_html = "\n".join(f"<li>{q}</li>" for q in cleaned_questions)
+    
+    body_plain = (
+        "Hi Student,\n\n"
+        "You recently completed the Front Desk Associate assessment.\n\n"
+        "YOUR RESULTS:\n"
+        f"Score: {score} ({percentage}%)\n"
+        "Status: Needs Improvement\n\n"
+        "We've analyzed your performance and attached a personalized study guide to help you revisit the areas that need attention.\n"
+        "Topics highlighted for revision:\n"
+        f"{topics_plain if topics_plain else '- Personalized to your recent attempt'}\n\n"
+        "Review the PDF before your next attempt to make the best progress.\n\n"
+        "Best regards,\n"
+        f"{EMAIL_SENDER_NAME}"
+    )
+
+    body_html = STUDY_GUIDE_EMAIL_HTML.substitute(
+        score=score,
+        percentage=percentage,
+        topics_html=topics_html,
+        sender_name=EMAIL_SENDER_NAME
+    )
+    
+    subject = "📚 Your Personalized Study Guide - Front Desk Associate"
+    
+    return {
+        "to_email": student_email,
+        "subject": subject,
+        "body_plain": body_plain,
+        "body_html": body_html,
+        "pdf_content": pdf_bytes,
+        "pdf_name": f"Study_Guide_{student_email.split('@')[0]}.pdf"
+    }
+
+def _send_over_idle_connection(idle_connections: queue.SimpleQueue, email_kwargs: dict) -> bool:
+    """Send one email over an idle connection from the batch, opening one if none is free"""
+    for attempt in range(2):
+        server = None
+        if not attempt:
+            try:
+                server = idle_connections.get_nowait()
+            except queue.Empty:
+                pass
+        if server is None:
+            # The retry always dials a new connection: the other pooled ones have
+            # been idle just as long and are likely to have been dropped too.
+            try:
+                server = open_smtp_connection()
+            except Exception as e:
+                print(f"❌ Could not connect to SMTP server: {str(e)}")
+                return False
+        
+        try:
+            sent = send_email_with_pdf(**email_kwargs, server=server)
+        except smtplib.SMTPServerDisconnected:
+            # Gmail drops connections that sit idle while guides are generated;
+            # discard this one and resend once over a fresh connection.
+            close_smtp_connection(server)
+            print(f"🔄 SMTP connection dropped while sending to {email_kwargs['to_email']}; reconnecting")
+            continue
+        
+        if sent:
+            idle_connections.put(server)
+        else:
+            # The connection may be what failed; let the next send open a fresh one
+            close_smtp_connection(server)
+        return sent
+    
+    print(f"❌ Failed to send email to {email_kwargs['to_email']}: SMTP server kept disconnecting")
+    return False
+
 @app.route('/process/assessment_and_email', methods=['POST'])
 def process_assessment_and_email():
     """Process assessment CSV and automatically email personalized content to weak students"""
@@ -1921,10 +2554,11 @@ def process_assessment_and_email():
         
         file = request.files['file']
         
+        # Assessment exports carry many unrelated columns; only parse the ones analysis can use
         if file.filename.endswith('.csv'):
-            df = pd.read_csv(file)
+            df = pd.read_csv(file, usecols=_is_assessment_column)
         elif file.filename.endswith(('.xlsx', '.xls')):
-            df = pd.read_excel(file)
+            df = pd.read_excel(file, usecols=_is_assessment_column)
         else:
             return jsonify({"error": "Invalid file format. Upload CSV or Excel"}), 400
         
@@ -1934,102 +2568,78 @@ def process_assessment_and_email():
         if 'error' in analysis:
             return jsonify({"error": analysis['error']}), 500
         
-        email_results = []
         student_details = analysis.get('student_details', [])
+        if not student_details:
+            print("📧 No students need support; nothing to email")
+            return jsonify({
+                "total_students": analysis['total_students'],
+                "average_score": round(analysis['average_score'], 1),
+                "emails_sent": 0,
+                "email_results": [],
+                "weak_questions": analysis['weak_questions']
+            }), 200
         
+        email_results = []
         print(f"📧 Processing {len(student_details)} students who need support...")
         
-        for student in student_details:
+        # Study guides are generated concurrently (RAG + OpenRouter are network-bound);
+        # each finished email is handed to a smaller send pool. Logged-in SMTP
+        # connections are reused across the batch (at most one per send worker)
+        # instead of a connect/STARTTLS/login per message. Each prepared email pins
+        # its PDF bytes until sent, so when SMTP is the bottleneck the content
+        # workers wait for a send slot rather than piling up finished PDFs.
+        def prepare_and_queue(student):
+            email_kwargs = _prepare_student_email(student)
+            send_slots.acquire()
             try:
-                student_email = student['email']
-                failed_questions = student['failed_questions']
-                score = student['score']
-                percentage = student['percentage']
-                
-                print(f"Generating content for {student_email}...")
-                
-                content = generate_personalized_content_for_student(student_email, failed_questions)
-                
-                pdf_buffer = generate_pdf(content, f"Personalized Study Guide - {student_email}")
-                pdf_bytes = pdf_buffer.getvalue()
-                
-                cleaned_questions = [clean_question_text(q) for q in failed_questions[:5]]
-                topics_plain = "\n".join([f"- {q}" for q in cleaned_questions]) if cleaned_questions else ""
-                
-                body_plain = (
-                    "Hi Student,\n\n"
-                    "You recently completed the Front Desk Associate assessment.\n\n"
-                    "YOUR RESULTS:\n"
-                    f"Score: {score} ({percentage}%)\n"
-                    "Status: Needs Improvement\n\n"
-                    "We've analyzed your performance and attached a personalized study guide to help you revisit the areas that need attention.\n"
-                    "Topics highlighted for revision:\n"
-                    f"{topics_plain if topics_plain else '- Personalized to your recent attempt'}\n\n"
-                    "Review the PDF before your next attempt to make the best progress.\n\n"
-                    "Best regards,\n"
-                    f"{EMAIL_SENDER_NAME}"
-                )
-
-                body_html = f"""
-                <div style="background-color: #f8f9fa; padding: 20px; border-radius: 5px; margin: 20px 0;">
-                    <h3 style="color: #2c3e50; margin-top: 0;">📊 YOUR RESULTS:</h3>
-                    <p style="font-size: 18px;"><strong>Score:</strong> {score} ({percentage}%)</p>
-                    <p style="color: #e74c3c;"><strong>Status:</strong> Needs Improvement</p>
-                </div>
-                <p>We've analyzed your performance and created a personalized study guide to help you master the concepts you found challenging.</p>
-                <div style="background-color: #fff3cd; padding: 15px; border-left: 4px solid #ffc107; margin: 20px 0;">
-                    <h4 style="color: #856404; margin-top: 0;">⚠️ TOPICS YOU STRUGGLED WITH:</h4>
-                    <ul style="color: #856404;">
-                        {chr(10).join([f"<li>{q}</li>" for q in cleaned_questions])}
-                    </ul>
-                </div>
-                <div style="background-color: #d4edda; padding: 15px; border-radius: 5px; margin: 20px 0;">
-                    <h4 style="color: #155724; margin-top: 0;">📎 ATTACHED: Your_Personalized_Study_Guide.pdf</h4>
-                    <p style="color: #155724; margin-bottom: 10px;"><strong>This guide includes:</strong></p>
-                    <ul style="color: #155724;">
-                        <li>Clear explanations of each topic</li>
-                        <li>Practical examples for Front Desk work</li>
-                        <li>Memory tips and tricks</li>
-                        <li>Practice questions with answers</li>
-                    </ul>
-                </div>
-                <p style="background-color: #e3f2fd; padding: 10px; border-left: 4px solid #2196f3; margin: 20px 0;">
-                    <strong>💡 TIP:</strong> Review this guide before your next attempt!
-                </p>
-                <p style="margin-top: 30px;">Best regards,<br><strong>{EMAIL_SENDER_NAME}</strong></p>
-                """
-                
-                subject = "📚 Your Personalized Study Guide - Front Desk Associate"
-                
-                success = send_email_with_pdf(
-                    to_email=student_email,
-                    subject=subject,
-                    body_plain=body_plain,
-                    body_html=body_html,
-                    pdf_content=pdf_bytes,
-                    pdf_name=f"Study_Guide_{student_email.split('@')[0]}.pdf"
-                )
-                
-                email_results.append({
-                    "email": student_email,
-                    "status": "✅ Sent" if success else "❌ Failed",
-                    "score": score,
-                    "percentage": percentage
-                })
-                
-            except Exception as e:
-                print(f"Error processing student {student['email']}: {str(e)}")
-                email_results.append({
-                    "email": student['email'],
-                    "status": f"❌ Error: {str(e)}",
-                    "score": student.get('score', 'N/A'),
-                    "percentage": student.get('percentage', 'N/A')
-                })
+                send_future = email_pool.submit(_send_over_idle_connection, idle_connections, email_kwargs)
+            except Exception:
+                send_slots.release()
+                raise
+            send_future.add_done_callback(lambda _: send_slots.release())
+            return send_future
+        
+        send_slots = threading.BoundedSemaphore(EMAIL_SEND_WORKERS * 2)
+        outcomes = []
+        idle_connections = queue.SimpleQueue()
+        try:
+            with ThreadPoolExecutor(max_workers=EMAIL_SEND_WORKERS, thread_name_prefix="email") as email_pool:
+                with ThreadPoolExecutor(max_workers=STUDENT_CONTENT_WORKERS, thread_name_prefix="study-guide") as content_pool:
+                    pending = [(student, content_pool.submit(prepare_and_queue, student)) for student in student_details]
+                    for student, future in pending:
+                        try:
+                            outcomes.append((student, future.result()))
+                        except Exception as e:
+                            print(f"Error processing student {student['email']}: {str(e)}")
+                            outcomes.append((student, e))
+                outcomes = [
+                    (student, outcome if isinstance(outcome, Exception) else outcome.result())
+                    for student, outcome in outcomes
+                ]
+        finally:
+            while not idle_connections.empty():
+                close_smtp_connection(idle_connections.get_nowait())
+        
+        emails_sent = 0
+        for student, outcome in outcomes:
+            if isinstance(outcome, Exception):
+                status = f"❌ Error: {str(outcome)}"
+            elif outcome:
+                status = "✅ Sent"
+                emails_sent += 1
+            else:
+                status = "❌ Failed"
+            email_results.append({
+                "email": student['email'],
+                "status": status,
+                "score": student.get('score', 'N/A'),
+                "percentage": student.get('percentage', 'N/A')
+            })
         
         return jsonify({
             "total_students": analysis['total_students'],
             "average_score": round(analysis['average_score'], 1),
-            "emails_sent": len([r for r in email_results if "✅" in r['status']]),
+            "emails_sent": emails_sent,
             "email_results": email_results,
             "weak_questions": analysis['weak_questions']
         }), 200
@@ -2039,6 +2649,24 @@ def process_assessment_and_email():
         traceback.print_exc()
         return jsonify({"error": str(e)}), 500
 
+@app.route('/process/assessment_and_email/submit', methods=['POST'])
+def submit_assessment_and_email():
+    """Queue assessment processing and emailing and return a job id"""
+    if 'file' not in request.files:
+        return jsonify({"error": "No file uploaded"}), 400
+    
+    # The upload stream is closed once this request ends, so hand the job its own copy
+    file = request.files['file']
+    upload = (io.BytesIO(file.read()), file.filename)
+    job_id = submit_job(
+        process_assessment_and_email,
+        path='/process/assessment_and_email',
+        method='POST',
+        data={'file': upload},
+        content_type='multipart/form-data'
+    )
+    return jsonify({"job_id": job_id, "status": "queued"}), 202
+
 @app.route('/search', methods=['POST'])
 def search():
     """Direct search endpoint for testing"""
@@ -2078,10 +2706,17 @@ if __name__ == '__main__':
     print("  POST /upload/course_data")
     print("  POST /upload/holidays")
     print("  POST /upload/guidelines")
+    print("  POST /upload/reference_bundle")
     print("  POST /create/assessment")
     print("  POST /create/lesson_plan")
     print("  POST /create/content")
+    print("  POST /create/assessment/submit")
+    print("  POST /create/lesson_plan/submit")
+    print("  POST /create/content/submit")
+    print("  GET  /jobs/<job_id>")
+    print("  GET  /jobs/<job_id>/result")
     print("  POST /process/assessment_and_email")
+    print("  POST /process/assessment_and_email/submit")
     print("  POST /search")
     print("=" * 50)
     print("\n✅ Server is ready to accept requests!\n")
@@ -1,5 +1,5 @@
 import os
-import json
+import orjson
 from dotenv import load_dotenv
 from pinecone import Pinecone
 from google.cloud import storage
@@ -30,16 +30,18 @@ def upsert_data():
 
     # Load vectors
     blob_vectors = bucket.blob(VECTOR_FILE)
-    vector_lines = blob_vectors.download_as_string().decode('utf-8').splitlines()
     vectors = {}
-    for line in vector_lines:
-        data = json.loads(line)
-        vectors[data['id']] = data['embedding']
+    # orjson parses the raw bytes of each line; no decode of the whole file to str
+    with blob_vectors.open('rb') as vector_file:
+        for line in vector_file:
+            if line.strip():
+                data = orjson.loads(line)
+                vectors[data['id']] = data['embedding']
     print(f"✅ Loaded {len(vectors)} vectors from GCS.")
 
     # Load metadata
     blob_metadata = bucket.blob(METADATA_FILE)
-    metadata = json.loads(blob_metadata.download_as_string())
+    metadata = orjson.loads(blob_metadata.download_as_bytes())
     print(f"✅ Loaded metadata for {len(metadata)} chunks from GCS.")
 
     print("Preparing data for upsert...")